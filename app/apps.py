@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from utils.metrics import install_query_recorder
+        from utils.slow_queries import install_slow_query_log
+        from utils.sqlite import apply_sqlite_pragmas
+        from . import signals  # noqa: F401
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='apply_sqlite_pragmas')
+        connection_created.connect(install_slow_query_log, dispatch_uid='install_slow_query_log')
+        connection_created.connect(install_query_recorder, dispatch_uid='install_query_recorder')
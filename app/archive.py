@@ -0,0 +1,141 @@
+import time
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from utils.authentication import invalidate_user_snapshot
+from .models import (ArchivedClient, ArchivedRecord, ArchivedWarehouse, Client, DeactivationJob, MovementRollup,
+                     RecordsModel, StockBalance, Warehouse, bulk_create_keeping_created_at)
+
+# hot model -> (archive model, columns the archive adds to the hot ones)
+ARCHIVES = {
+    RecordsModel: (ArchivedRecord, {'client_id': F('warehouse__client_id')}),
+    Warehouse: (ArchivedWarehouse, {}),
+    Client: (ArchivedClient, {}),
+}
+
+
+def hot_columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def archivable(model, cutoff):
+    """
+    Inactive rows last changed before cutoff. A warehouse or client only qualifies once
+    nothing below it is left in the hot tables and no deactivation of it is still open.
+    """
+    queryset = model.objects.filter(is_active=False, updated_at__lt=cutoff)
+    open_jobs = DeactivationJob.objects.filter(status__in=DeactivationJob.OPEN_STATUSES)
+    if model is Warehouse:
+        queryset = queryset.exclude(Exists(RecordsModel.objects.filter(warehouse_id=OuterRef('pk')))).exclude(
+            Exists(open_jobs.filter(warehouse_id=OuterRef('pk')))).exclude(
+            Exists(open_jobs.filter(client_id=OuterRef('client_id'))))
+    elif model is Client:
+        queryset = queryset.exclude(Exists(Warehouse.objects.filter(client_id=OuterRef('pk')))).exclude(
+            Exists(open_jobs.filter(client_id=OuterRef('pk'))))
+    return queryset.order_by('updated_at', model._meta.pk.attname)
+
+
+def drop_dependents(model, ids):
+    """Deletes what references the archived rows: reset balances, emptied rollups and finished jobs."""
+    if model is Warehouse:
+        StockBalance.objects.filter(warehouse_id__in=ids).delete()
+        MovementRollup.objects.filter(warehouse_id__in=ids).delete()
+        DeactivationJob.objects.filter(warehouse_id__in=ids).delete()
+    elif model is Client:
+        DeactivationJob.objects.filter(client_id__in=ids).delete()
+
+
+def archive_batch(model, cutoff, batch_size):
+    """
+    Moves one batch of archivable rows to their archive table in one transaction.
+    :return: Number of rows moved.
+    """
+    archive_model, extra_columns = ARCHIVES[model]
+    with transaction.atomic():
+        queryset = archivable(model, cutoff).select_for_update()
+        rows = list(queryset.values(*hot_columns(model), **extra_columns)[:batch_size])
+        if not rows:
+            return 0
+        ids = [row[model._meta.pk.attname] for row in rows]
+        archive_model.objects.bulk_create([archive_model(**row) for row in rows])
+        drop_dependents(model, ids)
+        # Archived rows are inactive, so no cached response or aggregate counts them and the
+        # per-row post_delete receivers have nothing to do; skip the collector.
+        model.objects.filter(pk__in=ids)._raw_delete(model.objects.db)
+    if model is Client:
+        for user_id in ids:
+            invalidate_user_snapshot(user_id)
+    return len(ids)
+
+
+def archive_inactive(cutoff, batch_size, pause=0):
+    """
+    Moves the inactive records, then warehouses, then clients last changed before
+    cutoff out of the hot tables, in batches of short transactions.
+    :return: Dict of model name -> rows archived.
+    """
+    archived = {}
+    for model in (RecordsModel, Warehouse, Client):
+        archived[model.__name__] = 0
+        while True:
+            moved = archive_batch(model, cutoff, batch_size)
+            if not moved:
+                break
+            archived[model.__name__] += moved
+            if pause:
+                time.sleep(pause)
+    return archived
+
+
+def restore_batch(model, archived, batch_size):
+    """
+    Moves one batch of the archived rows back to the hot table, still inactive.
+    :return: Number of rows moved.
+    """
+    archive_model = ARCHIVES[model][0]
+    with transaction.atomic():
+        rows = list(archived.order_by(archive_model._meta.pk.attname).values(*hot_columns(model))[:batch_size])
+        if not rows:
+            return 0
+        # updated_at moves to now, so sync clients see the restored rows again as tombstones
+        bulk_create_keeping_created_at(model, [model(**row) for row in rows])
+        archive_model.objects.filter(pk__in=[row[model._meta.pk.attname] for row in rows]).delete()
+    return len(rows)
+
+
+def restore_archived(client_id=None, warehouse_id=None, record_id=None, batch_size=1000):
+    """
+    Moves archived rows back to the hot tables: a client with its warehouses and records,
+    a warehouse with its records, or a single record. The rows above the target are
+    restored too when they were archived, so the foreign keys hold.
+    :return: Dict of model name -> rows restored.
+    """
+    if record_id is not None:
+        record = ArchivedRecord.objects.filter(pk=record_id).first()
+        warehouse_id = record.warehouse_id if record else None
+    if warehouse_id is not None:
+        warehouse = ArchivedWarehouse.objects.filter(pk=warehouse_id).first()
+        client_id = warehouse.client_id if warehouse else (
+            Warehouse.objects.filter(pk=warehouse_id).values_list('client_id', flat=True).first())
+
+    targets = [(Client, ArchivedClient.objects.filter(pk=client_id))]
+    if record_id is not None:
+        targets += [(Warehouse, ArchivedWarehouse.objects.filter(pk=warehouse_id)),
+                    (RecordsModel, ArchivedRecord.objects.filter(pk=record_id))]
+    elif warehouse_id is not None:
+        targets += [(Warehouse, ArchivedWarehouse.objects.filter(pk=warehouse_id)),
+                    (RecordsModel, ArchivedRecord.objects.filter(warehouse_id=warehouse_id))]
+    else:
+        targets += [(Warehouse, ArchivedWarehouse.objects.filter(client_id=client_id)),
+                    (RecordsModel, ArchivedRecord.objects.filter(client_id=client_id))]
+
+    restored = {}
+    for model, archived in targets:
+        restored[model.__name__] = 0
+        while True:
+            moved = restore_batch(model, archived, batch_size)
+            if not moved:
+                break
+            restored[model.__name__] += moved
+    if restored['Client']:
+        invalidate_user_snapshot(client_id)
+    return restored
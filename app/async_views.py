@@ -0,0 +1,141 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.http import HttpResponse, HttpResponseNotModified
+from django.urls import resolve
+from django.utils.cache import patch_vary_headers
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from utils.cache import response_cache, user_scope
+from utils.replica import read_database, reset_reads, route_reads
+from .models import StockBalance
+from .serializers import StockBalanceSerializer
+
+
+class Fallback(Exception):
+    """The request leaves the async path and is answered by the sync viewset."""
+
+
+class AsyncReadView(View):
+    """
+    Answers a read action of a DRF viewset with the async ORM, so under ASGI the
+    request does not hold a worker thread while it waits on the database.
+    The viewset's get_queryset, permissions, serializer and response cache key
+    are reused, so both paths return the same JSON. Anything else (writes,
+    ?format=, the browsable API, X-Commit-Token reads, authentication or
+    permission errors, 404s) is handed to the sync viewset, which owns the
+    error responses.
+    """
+    viewset = None
+    action = None
+    sync_urlconf = 'project.urls'
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        if (request.method != 'GET' or 'format' in request.GET or 'X-Commit-Token' in request.headers
+                or 'text/html' in request.headers.get('Accept', '')):
+            return await self.fallback(request)
+        try:
+            return await self.get(request, *args, **kwargs)
+        except Fallback:
+            return await self.fallback(request)
+
+    async def fallback(self, request):
+        match = resolve(request.path_info, urlconf=self.sync_urlconf)
+        request.resolver_match = match
+        return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+    async def get(self, request, *args, **kwargs):
+        view = await self.initialize_viewset(request, kwargs)
+        if self.action not in getattr(view, 'replica_actions', ()):
+            return await self.respond(view, request, kwargs)
+        token = route_reads(read_database(user_scope(view.request.user)))
+        try:
+            return await self.respond(view, request, kwargs)
+        finally:
+            reset_reads(token)
+
+    async def respond(self, view, request, kwargs):
+        load = getattr(self, f'load_{self.action}')
+        if not settings.API_RESPONSE_CACHE_ENABLED:
+            return self.render(await load(view))
+
+        key, headers = view.response_cache_key(view.request, kwargs)
+        if headers['ETag'] in request.headers.get('If-None-Match', ''):
+            return self.render(None, headers)
+        cache = response_cache()
+        data = cache.get(key)
+        if data is None:
+            data = await load(view)
+            cache.set(key, data, settings.API_RESPONSE_CACHE_TIMEOUT)
+        return self.render(data, headers)
+
+    async def initialize_viewset(self, request, kwargs):
+        view = self.viewset(action_map={'get': self.action}, format_kwarg=None)
+        view.action, view.args, view.kwargs, view.headers = self.action, (), kwargs, {}
+        view.request = Request(request, parsers=view.get_parsers(), negotiator=view.get_content_negotiator())
+        view.request.accepted_renderer, view.request.accepted_media_type = self.renderer, self.renderer.media_type
+
+        try:
+            for authenticator in view.get_authenticators():
+                if not hasattr(authenticator, 'aauthenticate'):
+                    raise Fallback
+                result = await authenticator.aauthenticate(request)
+                if result is not None:
+                    view.request.user, view.request.auth = result
+                    break
+            else:
+                raise Fallback
+            view.check_permissions(view.request)
+        except exceptions.APIException:
+            raise Fallback
+        return view
+
+    async def aget_object(self, view):
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        queryset = view.filter_queryset(view.get_queryset())
+        try:
+            instance = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+            view.check_object_permissions(view.request, instance)
+        except (ObjectDoesNotExist, ValidationError, ValueError, exceptions.APIException):
+            raise Fallback
+        return instance
+
+    async def load_list(self, view):
+        queryset = view.filter_queryset(view.get_queryset())
+        values_serializer = view.get_values_serializer() if hasattr(view, 'get_values_serializer') else None
+        if values_serializer is None:
+            serialize = lambda rows: view.get_serializer(rows, many=True).data
+        else:
+            queryset = view.values_queryset(queryset, values_serializer)
+            serialize = values_serializer.to_representation
+        page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+        if page is None:
+            return serialize([row async for row in queryset])
+        return view.paginator.get_paginated_response(serialize(page)).data
+
+    async def load_retrieve(self, view):
+        return view.get_serializer(await self.aget_object(view)).data
+
+    async def load_stock(self, view):
+        warehouse = await self.aget_object(view)
+        balance = await StockBalance.objects.filter(warehouse=warehouse).afirst() or StockBalance(warehouse=warehouse)
+        return StockBalanceSerializer(balance).data
+
+    def render(self, data, headers=None):
+        if data is None:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(self.renderer.render(data), status=status.HTTP_200_OK,
+                                    content_type=self.renderer.media_type)
+        for header, value in (headers or {}).items():
+            response[header] = value
+        patch_vary_headers(response, ['Accept'])
+        return response
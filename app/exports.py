@@ -0,0 +1,50 @@
+import csv
+import json
+from uuid import UUID
+from datetime import datetime
+
+# (output column, model field) in the order of RecordsSerializer.Meta.fields
+RECORD_EXPORT_FIELDS = [
+    ('id_record', 'id_record'),
+    ('id_warehouse', 'warehouse_id'),
+    ('type_record', 'type_record'),
+    ('quantity', 'quantity'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('is_active', 'is_active'),
+]
+
+
+class Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def export_rows(queryset, chunk_size):
+    columns = [field for _, field in RECORD_EXPORT_FIELDS]
+    for row in queryset.values_list(*columns).iterator(chunk_size=chunk_size):
+        yield [export_value(value) for value in row]
+
+
+def export_records_csv(queryset, chunk_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in RECORD_EXPORT_FIELDS])
+    for row in export_rows(queryset, chunk_size):
+        yield writer.writerow(row)
+
+
+def export_records_ndjson(queryset, chunk_size):
+    names = [name for name, _ in RECORD_EXPORT_FIELDS]
+    for row in export_rows(queryset, chunk_size):
+        yield json.dumps(dict(zip(names, row))) + '\n'
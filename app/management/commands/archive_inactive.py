@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from app.archive import archive_inactive
+
+
+class Command(BaseCommand):
+    help = ("Moves inactive records, warehouses and clients unchanged for --older-than days from the hot "
+            "tables to the archive tables, in batches of short transactions. Warehouses and clients wait "
+            "until their deactivation finished and nothing below them is left. Undo with restore_archived.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, required=True,
+                            help="Days since the row was deactivated (its updated_at).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches, leaving the write lock to other writers.")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError("--older-than must not be negative.")
+        cutoff = timezone.now() - timedelta(days=options['older_than'])
+        archived = archive_inactive(cutoff, options['batch_size'], pause=options['pause'])
+        self.stdout.write(f"Archived {archived['RecordsModel']} record(s), {archived['Warehouse']} warehouse(s) "
+                          f"and {archived['Client']} client(s) inactive since before {cutoff.isoformat()}.")
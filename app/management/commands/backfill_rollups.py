@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from app.models import MovementRollup, RecordsModel
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the hourly movement rollups from the records ledger, one time window per transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-hours', type=int, default=24,
+                            help="Size of the ledger window aggregated and committed at once.")
+        parser.add_argument('--since', help="ISO datetime to start from, defaults to the oldest record.")
+
+    def handle(self, *args, **options):
+        step = timedelta(hours=options['chunk_hours'])
+        if options['since']:
+            start = MovementRollup.bucket_for(datetime.fromisoformat(options['since']))
+            if timezone.is_naive(start):
+                start = timezone.make_aware(start)
+        else:
+            oldest = RecordsModel.objects.aggregate(oldest=Min('created_at'))['oldest']
+            if oldest is None:
+                self.stdout.write("The ledger is empty, nothing to backfill.")
+                return
+            start = MovementRollup.bucket_for(oldest)
+        now = timezone.now()
+
+        while start <= now:
+            end = start + step
+            written = self.backfill_window(start, end)
+            self.stdout.write(f"{start:%Y-%m-%d %H:00} .. {end:%Y-%m-%d %H:00}: {written} bucket(s)")
+            start = end
+        self.stdout.write(self.style.SUCCESS("Movement rollups backfilled."))
+
+    def backfill_window(self, start, end):
+        """
+        Windows are aligned on hours, so every bucket inside one is rewritten
+        from scratch and re-running the command is idempotent.
+        """
+        rows = (RecordsModel.objects
+                .filter(is_active=True, warehouse__is_active=True, type_record__in=['IN', 'OUT'],
+                        created_at__gte=start, created_at__lt=end)
+                .annotate(bucket=TruncHour('created_at'))
+                .values('warehouse_id', 'bucket', 'type_record')
+                .annotate(quantity=Sum('quantity'), count=Count('id_record'))
+                .order_by())
+        rollups = [MovementRollup(warehouse_id=row['warehouse_id'], bucket=row['bucket'], type_record=row['type_record'],
+                                  total_quantity=row['quantity'], record_count=row['count']) for row in rows]
+        with transaction.atomic():
+            MovementRollup.objects.filter(bucket__gte=start, bucket__lt=end).delete()
+            MovementRollup.objects.bulk_create(rollups, batch_size=500)
+        return len(rollups)
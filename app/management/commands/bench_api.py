@@ -0,0 +1,214 @@
+import json
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.models import Client, CustomUser, RecordsModel, Warehouse
+from .seed_data import seed_data
+
+DEFAULT_SIZES = ['5x4x25', '20x5x100']
+
+
+def parse_size(size):
+    try:
+        clients, warehouses, records = (int(part) for part in size.split('x'))
+    except ValueError:
+        raise CommandError(f"Invalid size {size!r}, expected CLIENTSxWAREHOUSESxRECORDS such as 20x5x100.")
+    return clients, warehouses, records
+
+
+def summarize(latencies, queries, errors):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(quantiles[49], 3),
+        'p90_ms': round(quantiles[89], 3),
+        'p99_ms': round(quantiles[98], 3),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def compare_reports(report, baseline, tolerance):
+    """
+    :return: Descriptions of the endpoints that run more queries than in the baseline,
+             or whose median latency grew by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for size, previous in baseline.get('sizes', {}).items():
+        current = report['sizes'].get(size)
+        if current is None:
+            continue
+        for name, before in previous['endpoints'].items():
+            after = current['endpoints'].get(name)
+            if after is None:
+                continue
+            if after['queries_max'] > before['queries_max']:
+                regressions.append(f"{size} {name}: {before['queries_max']} -> {after['queries_max']} queries")
+            if after['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{size} {name}: p50 {before['p50_ms']} -> {after['p50_ms']} ms")
+            if after['errors'] > before['errors']:
+                regressions.append(f"{size} {name}: {before['errors']} -> {after['errors']} errors")
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ("Calls every API endpoint through the test client at several data sizes, seeded with seed_data, "
+            "and reports latency percentiles and SQL queries per endpoint as JSON. With --baseline, fails "
+            "when an endpoint runs more queries or is slower than in a previous report. "
+            "Each size runs inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES,
+                            help="Data sizes as CLIENTSxWAREHOUSESxRECORDS (records per warehouse).")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per endpoint and size.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed growth of the median latency over the baseline, as a fraction.")
+        parser.add_argument('--with-cache', action='store_true', help="Keep the API response cache enabled.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        report = {'generated_at': timezone.now().isoformat(), 'repeat': options['repeat'], 'sizes': {}}
+        with override_settings(ALLOWED_HOSTS=['testserver'], API_RESPONSE_CACHE_ENABLED=options['with_cache']):
+            for size in options['sizes']:
+                clients, warehouses, records = parse_size(size)
+                with transaction.atomic():
+                    seed_data(clients, warehouses, records, rng=random.Random(options['seed']))
+                    report['sizes'][size] = {
+                        'records': clients * warehouses * records,
+                        'endpoints': self.run_endpoints(options['repeat']),
+                    }
+                    transaction.set_rollback(True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+            regressions = compare_reports(report, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stderr.write("No regression against the baseline.")
+
+    def run_endpoints(self, repeat):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.admin = CustomUser.objects.create_superuser(username=f'bench-admin-{self.run_id}', password='password')
+        self.client_obj = Client.objects.filter(is_active=True).select_related('user').order_by('-created_at').first()
+        self.warehouse = Warehouse.objects.filter(client=self.client_obj, is_active=True).first()
+        self.record = RecordsModel.objects.filter(warehouse=self.warehouse, is_active=True).first()
+        tokens = {'staff': RefreshToken.for_user(self.admin), 'client': RefreshToken.for_user(self.client_obj.user)}
+        apis = {}
+        for user, token in tokens.items():
+            apis[user] = APIClient()
+            apis[user].credentials(HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        apis['anonymous'] = APIClient()
+
+        results = {}
+        for name, user, expected_status, build in self.endpoints():
+            latencies, queries, errors = [], [], 0
+            for iteration in range(repeat):
+                method, path, data = build(iteration)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = getattr(apis[user], method)(path, data, format='json')
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    latencies.append(time.perf_counter() - started)
+                queries.append(len(captured))
+                errors += response.status_code != expected_status
+            results[f'{name} [{user}]'] = summarize(latencies, queries, errors)
+        return results
+
+    def fresh_client(self, iteration):
+        user = CustomUser.objects.create_user(username=f'bench-{self.run_id}-{iteration}-{uuid.uuid4().hex[:6]}')
+        client = Client.objects.create(user=user)
+        warehouse = Warehouse.objects.create(name='bench', address='bench', client=client)
+        RecordsModel.objects.bulk_create([RecordsModel(warehouse=warehouse, type_record='IN', quantity=1)
+                                          for _ in range(10)])
+        return client, warehouse
+
+    def endpoints(self):
+        """
+        (name, user, expected status, build) where build(iteration) returns the method, path and body
+        of one request, creating what a destructive request consumes. The admin site is left out.
+        """
+        client, warehouse, record = self.client_obj, self.warehouse, self.record
+        username = client.user.username
+        now = timezone.now()
+        report = f'/api/reports/movements/?start={(now - timedelta(days=31)).isoformat()}&end={now.isoformat()}'
+        report = report.replace('+', '%2B')
+        bulk = [{'id_warehouse': str(warehouse.id), 'type_record': 'IN', 'quantity': 1} for _ in range(100)]
+
+        def warehouse_body(iteration):
+            return {'id_warehouse': str(warehouse.id), 'name': f'bench-{iteration}', 'address': 'bench',
+                    'id_client': str(client.pk)}
+
+        endpoints = [
+            ('POST /api/login/', 'anonymous', 200,
+             lambda i: ('post', '/api/login/', {'username': username, 'password': 'password'})),
+            ('POST /api/token/refresh/', 'anonymous', 200,
+             lambda i: ('post', '/api/token/refresh/', {'refresh': str(RefreshToken.for_user(client.user))})),
+            ('POST /api/logout/', 'anonymous', 200,
+             lambda i: ('post', '/api/logout/', {'refresh': str(RefreshToken.for_user(client.user))})),
+            ('GET /api/schema/', 'anonymous', 200, lambda i: ('get', '/api/schema/', None)),
+            ('GET /api/docs/', 'anonymous', 200, lambda i: ('get', '/api/docs/', None)),
+            ('GET /api/redoc/', 'anonymous', 200, lambda i: ('get', '/api/redoc/', None)),
+            ('POST /api/client/register/', 'staff', 201, lambda i: (
+                'post', '/api/client/register/', {'username': f'bench-register-{self.run_id}-{i}', 'password': 'password'})),
+            ('PUT /api/clients/{id}/', 'staff', 200, lambda i: ('put', f'/api/clients/{client.pk}/', {})),
+            ('PATCH /api/clients/{id}/', 'staff', 200, lambda i: ('patch', f'/api/clients/{client.pk}/', {})),
+            ('DELETE /api/clients/{id}/', 'staff', 204,
+             lambda i: ('delete', f'/api/clients/{self.fresh_client(i)[0].pk}/', None)),
+            ('POST /api/warehouses/', 'staff', 201, lambda i: ('post', '/api/warehouses/', warehouse_body(i))),
+            ('PUT /api/warehouses/{id}/', 'staff', 200,
+             lambda i: ('put', f'/api/warehouses/{warehouse.id}/', warehouse_body(i))),
+            ('DELETE /api/warehouses/{id}/', 'staff', 204,
+             lambda i: ('delete', f'/api/warehouses/{self.fresh_client(i)[1].id}/', None)),
+            ('POST /api/records/', 'staff', 201, lambda i: (
+                'post', '/api/records/', {'id_warehouse': str(warehouse.id), 'type_record': 'IN', 'quantity': 1})),
+            ('PUT /api/records/{id}/', 'staff', 200, lambda i: (
+                'put', f'/api/records/{record.id_record}/',
+                {'id_warehouse': str(warehouse.id), 'type_record': 'IN', 'quantity': 1})),
+            ('DELETE /api/records/{id}/', 'staff', 204, lambda i: (
+                'delete', f'/api/records/{RecordsModel.objects.create(warehouse=warehouse, type_record="IN", quantity=1).id_record}/',
+                None)),
+            ('POST /api/records/bulk/', 'staff', 201, lambda i: ('post', '/api/records/bulk/', bulk)),
+            ('GET /api/deactivations/', 'staff', 200, lambda i: ('get', '/api/deactivations/', None)),
+            ('GET /api/metrics', 'staff', 200, lambda i: ('get', '/api/metrics', None)),
+        ]
+        for user in ('staff', 'client'):
+            endpoints += [
+                ('GET /api/clients/', user, 200, lambda i: ('get', '/api/clients/', None)),
+                ('GET /api/clients/?expand=warehouses,records', user, 200,
+                 lambda i: ('get', '/api/clients/?expand=warehouses,records', None)),
+                ('GET /api/clients/{id}/', user, 200, lambda i: ('get', f'/api/clients/{client.pk}/', None)),
+                ('GET /api/warehouses/', user, 200, lambda i: ('get', '/api/warehouses/', None)),
+                ('GET /api/warehouses/?expand=records,stock', user, 200,
+                 lambda i: ('get', '/api/warehouses/?expand=records,stock', None)),
+                ('GET /api/warehouses/{id}/', user, 200, lambda i: ('get', f'/api/warehouses/{warehouse.id}/', None)),
+                ('GET /api/warehouses/{id}/stock/', user, 200,
+                 lambda i: ('get', f'/api/warehouses/{warehouse.id}/stock/', None)),
+                ('GET /api/records/', user, 200, lambda i: ('get', '/api/records/', None)),
+                ('GET /api/records/{id}/', user, 200, lambda i: ('get', f'/api/records/{record.id_record}/', None)),
+                ('GET /api/records/export/', user, 200, lambda i: ('get', '/api/records/export/?format=csv', None)),
+                ('GET /api/reports/movements/', user, 200, lambda i: ('get', report, None)),
+                ('GET /api/sync/', user, 200, lambda i: ('get', '/api/sync/', None)),
+            ]
+        return endpoints
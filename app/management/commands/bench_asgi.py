@@ -0,0 +1,136 @@
+import asyncio
+import io
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from app.models import Client, CustomUser, RecordsModel, Warehouse, add_records_aggregates
+
+HOST = 'bench.local'
+
+
+class Command(BaseCommand):
+    help = ("Compares requests/s and latency of the read endpoints served by the WSGI application "
+            "(sync views, one thread per request) and the ASGI application (async views) on the "
+            "configured database. Requests go through the real handlers in process, without a server. "
+            "Seeds a throwaway client and deletes it afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--warehouses', type=int, default=20)
+        parser.add_argument('--records', type=int, default=50, help="Records per warehouse.")
+        parser.add_argument('--with-cache', action='store_true', help="Keep the API response cache enabled.")
+
+    def handle(self, *args, **options):
+        client, warehouses = self.seed(options['warehouses'], options['records'])
+        token = str(RefreshToken.for_user(client.user).access_token)
+        paths = ['/api/warehouses/', '/api/records/']
+        for warehouse_id in warehouses:
+            paths += [f'/api/warehouses/{warehouse_id}/', f'/api/warehouses/{warehouse_id}/stock/']
+        paths = [paths[index % len(paths)] for index in range(options['requests'])]
+
+        try:
+            with override_settings(ALLOWED_HOSTS=[HOST], API_RESPONSE_CACHE_ENABLED=options['with_cache']):
+                with override_settings(ROOT_URLCONF='project.urls'):
+                    wsgi = self.run_wsgi(get_wsgi_application(), paths, token, options['concurrency'])
+                # Same settings as project/asgi.py: no persistent connections under ASGI.
+                database = connections.settings[DEFAULT_DB_ALIAS]
+                conn_max_age, database['CONN_MAX_AGE'] = database['CONN_MAX_AGE'], 0
+                try:
+                    with override_settings(ROOT_URLCONF='project.asgi_urls'):
+                        asgi = asyncio.run(self.run_asgi(get_asgi_application(), paths, token, options['concurrency']))
+                finally:
+                    database['CONN_MAX_AGE'] = conn_max_age
+        finally:
+            client.user.delete()
+
+        for label, (elapsed, latencies, errors) in (('wsgi', wsgi), ('asgi', asgi)):
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{label}: {len(latencies) / elapsed:>8.0f} requests/s "
+                f"p50 {quantiles[49] * 1000:>7.1f} ms p99 {quantiles[98] * 1000:>7.1f} ms "
+                f"{errors} error(s)")
+
+    def seed(self, warehouse_count, records_per_warehouse):
+        username = f"bench-{uuid.uuid4().hex[:12]}"
+        client = Client.objects.create(user=CustomUser.objects.create_user(username=username, password=uuid.uuid4().hex))
+        warehouses = Warehouse.objects.bulk_create(
+            [Warehouse(name=f'{username}-{index}', address='bench', client=client) for index in range(warehouse_count)])
+        records = RecordsModel.objects.bulk_create(
+            [RecordsModel(warehouse=warehouse, type_record='IN', quantity=1)
+             for warehouse in warehouses for _ in range(records_per_warehouse)], batch_size=500)
+        add_records_aggregates(records)
+        return client, [warehouse.id for warehouse in warehouses]
+
+    def environ(self, path, token):
+        return {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'HTTP_AUTHORIZATION': f'Bearer {token}',
+            'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+            'wsgi.errors': io.StringIO(), 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        }
+
+    def scope(self, path, token):
+        return {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', HOST.encode()), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+        }
+
+    def run_wsgi(self, application, paths, token, concurrency):
+        def request(path):
+            statuses = []
+            started = time.perf_counter()
+            result = application(self.environ(path, token), lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(result)
+            finally:
+                result.close()
+            return time.perf_counter() - started, statuses[0].startswith('200')
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(request, paths))
+        return self.summarize(time.perf_counter() - started, results)
+
+    async def run_asgi(self, application, paths, token, concurrency):
+        pending = iter(paths)
+        results = []
+
+        async def request(path):
+            messages = []
+            body_sent = False
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Only reached by Django's disconnect listener, which is cancelled with the response.
+                await asyncio.Event().wait()
+
+            async def send(message):
+                messages.append(message)
+
+            started = time.perf_counter()
+            await application(self.scope(path, token), receive, send)
+            return time.perf_counter() - started, messages[0]['status'] == 200
+
+        async def worker():
+            for path in pending:
+                results.append(await request(path))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return self.summarize(time.perf_counter() - started, results)
+
+    def summarize(self, elapsed, results):
+        return elapsed, [latency for latency, _ in results], sum(1 for _, ok in results if not ok)
@@ -0,0 +1,62 @@
+import time
+import uuid
+from unittest import mock
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from app.models import Client, CustomUser
+from app.serializers import LoginResponseSerializer
+from app.views import LoginView
+
+
+def legacy_login(data):
+    """The previous LoginView flow: lookup, lazy client load, authenticate again, validate the response."""
+    user = CustomUser.objects.get(username=data['username'])
+    if user.is_superuser or (user.is_active and hasattr(user, 'client') and user.client.is_active):
+        token_serializer = TokenObtainPairSerializer(data=data)
+        token_serializer.is_valid(raise_exception=True)
+    response_serializer = LoginResponseSerializer(data={
+        'access': token_serializer.validated_data['access'],
+        'refresh': token_serializer.validated_data['refresh'],
+        'user_id': str(user.id),
+        'username': user.username,
+    })
+    response_serializer.is_valid(raise_exception=True)
+
+
+class Command(BaseCommand):
+    help = ("Reports SQL queries, PBKDF2 derivations and latency per login for the previous and the "
+            "current login path. Runs inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = {'username': f"bench-{uuid.uuid4().hex[:12]}", 'password': uuid.uuid4().hex}
+            Client.objects.create(user=CustomUser.objects.create_user(**data))
+            factory = APIRequestFactory()
+            view = LoginView.as_view()
+
+            def current_login(data):
+                response = view(factory.post('/api/login/', data, format='json'))
+                assert response.status_code == 200, response.data
+
+            for label, login in (('previous', legacy_login), ('current', current_login)):
+                self.measure(label, login, data, options['logins'])
+            transaction.set_rollback(True)
+
+    def measure(self, label, login, data, logins):
+        with mock.patch.object(hashers, 'pbkdf2', wraps=hashers.pbkdf2) as pbkdf2, \
+                CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(logins):
+                login(data)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:>8}: {len(queries) / logins:.1f} queries/login, "
+            f"{pbkdf2.call_count / logins:.1f} hash operations/login, "
+            f"{elapsed * 1000 / logins:.1f} ms/login")
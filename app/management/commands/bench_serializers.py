@@ -0,0 +1,47 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from app.models import Client, CustomUser, RecordsModel, Warehouse
+from app.serializers import RecordsSerializer, WarehouseSerializer
+from utils.serializers import ValuesSerializer
+
+
+class Command(BaseCommand):
+    help = ("Reports rows/s of the record and warehouse listings through the model serializers and "
+            "through the .values() fast path, query included. Runs inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Records seeded before measuring.")
+        parser.add_argument('--warehouses', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['rows'], options['warehouses'])
+            cases = (
+                ('records', RecordsSerializer, RecordsModel.objects.all()),
+                ('warehouses', WarehouseSerializer, Warehouse.objects.select_related('client__user')),
+            )
+            for label, serializer_class, queryset in cases:
+                queryset = queryset.order_by('created_at', 'pk')
+                values_serializer = ValuesSerializer.for_serializer(serializer_class(context={}))
+                serializer = self.measure(lambda: serializer_class(queryset, many=True, context={}).data)
+                values = self.measure(lambda: values_serializer.to_representation(
+                    queryset.values(*values_serializer.columns)))
+                self.stdout.write(f"{label:>10}: serializer {serializer:>9.0f} rows/s, "
+                                  f"values {values:>9.0f} rows/s ({values / serializer:.1f}x)")
+            transaction.set_rollback(True)
+
+    def seed(self, rows, warehouse_count):
+        username = f"bench-{uuid.uuid4().hex[:12]}"
+        client = Client.objects.create(user=CustomUser.objects.create_user(username=username, password=uuid.uuid4().hex))
+        warehouses = Warehouse.objects.bulk_create(
+            [Warehouse(name=f'{username}-{index}', address='bench', client=client) for index in range(warehouse_count)])
+        RecordsModel.objects.bulk_create(
+            [RecordsModel(warehouse=warehouses[index % warehouse_count], type_record='IN', quantity=index)
+             for index in range(rows)], batch_size=1000)
+
+    def measure(self, serialize):
+        started = time.perf_counter()
+        rows = len(serialize())
+        return rows / (time.perf_counter() - started)
@@ -0,0 +1,96 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from utils.sqlite import sqlite_pragmas
+
+BASELINE_PROFILE = {'JOURNAL_MODE': 'DELETE', 'SYNCHRONOUS': 'FULL'}
+
+
+class Command(BaseCommand):
+    help = ("Measures mixed read/write throughput on a scratch SQLite file with the stock settings "
+            "and with the SQLITE_TUNING profile.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--rows', type=int, default=20000, help="Ledger rows seeded before measuring.")
+        parser.add_argument('--warehouses', type=int, default=50)
+
+    def handle(self, *args, **options):
+        for label, profile in (('stock', BASELINE_PROFILE), ('tuned', None)):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                warehouses = self.seed(path, options['rows'], options['warehouses'])
+                result = self.run(path, sqlite_pragmas(profile), warehouses, options)
+            self.stdout.write(
+                f"{label:>5}: {result['reads'] / options['seconds']:>9.0f} reads/s "
+                f"{result['writes'] / options['seconds']:>8.0f} writes/s "
+                f"{result['locked']} locked error(s)")
+
+    def connect(self, path, pragmas):
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for statement in pragmas:
+            connection.execute(statement)
+        return connection
+
+    def seed(self, path, rows, warehouse_count):
+        warehouses = [uuid.uuid4().hex for _ in range(warehouse_count)]
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE records (id_record TEXT PRIMARY KEY, warehouse_id TEXT, "
+                           "type_record TEXT, quantity INTEGER, created_at TEXT, is_active INTEGER)")
+        connection.execute("CREATE INDEX records_warehouse ON records (warehouse_id, created_at) WHERE is_active")
+        connection.executemany(
+            "INSERT INTO records VALUES (?, ?, 'IN', ?, datetime('now'), 1)",
+            ((uuid.uuid4().hex, random.choice(warehouses), random.randint(1, 100)) for _ in range(rows)))
+        connection.commit()
+        connection.close()
+        return warehouses
+
+    def run(self, path, pragmas, warehouses, options):
+        result = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['seconds']
+
+        def count(key):
+            with lock:
+                result[key] += 1
+
+        def reader():
+            connection = self.connect(path, pragmas)
+            while time.monotonic() < deadline:
+                try:
+                    connection.execute("SELECT SUM(quantity) FROM records WHERE warehouse_id = ? AND is_active",
+                                       (random.choice(warehouses),)).fetchone()
+                    count('reads')
+                except sqlite3.OperationalError:
+                    count('locked')
+            connection.close()
+
+        def writer():
+            connection = self.connect(path, pragmas)
+            while time.monotonic() < deadline:
+                try:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute("INSERT INTO records VALUES (?, ?, 'OUT', 1, datetime('now'), 1)",
+                                       (uuid.uuid4().hex, random.choice(warehouses)))
+                    connection.execute("COMMIT")
+                    count('writes')
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    count('locked')
+            connection.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return result
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from utils.schema import SCHEMA_RENDERERS, code_version, schema_cache
+
+
+class Command(BaseCommand):
+    help = ("Generates the OpenAPI schema of the current code version into API_SCHEMA_CACHE_DIR, "
+            "where the workers serving /api/schema/ read it. Run it on deploy, before the workers start.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-old', action='store_true',
+                            help="Keep the schemas of other code versions, for a rolling deploy.")
+
+    def handle(self, *args, **options):
+        schema_cache.write()
+        if not options['keep_old']:
+            for path in schema_cache.prune():
+                self.stdout.write(f"Removed {path}.")
+        for name in SCHEMA_RENDERERS:
+            self.stdout.write(f"Wrote {schema_cache.path(name)}.")
+        self.stdout.write(f"Schema of code version {code_version()} in {settings.API_SCHEMA_CACHE_DIR}.")
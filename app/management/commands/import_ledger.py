@@ -0,0 +1,111 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from utils.cache import bump_client_versions
+from app.models import (Client, CustomUser, LedgerImport, RecordsModel, Warehouse, add_records_aggregates,
+                        bulk_create_keeping_created_at)
+
+
+class Command(BaseCommand):
+    help = ("Imports historical movements from a CSV or NDJSON file with the columns "
+            "username, warehouse, address, type_record, quantity and an optional created_at. "
+            "Missing clients and warehouses are created. Every chunk is committed together with "
+            "a checkpoint, so a failed run resumes after its last committed chunk.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Input format, guessed from the file extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore the checkpoint of a previous run and import from the first row.")
+
+    def read_rows(self, path, input_format):
+        with open(path, newline='', encoding='utf-8') as handle:
+            if input_format == 'csv':
+                yield from csv.DictReader(handle)
+            else:
+                for line in handle:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def load_lookups(self):
+        self.clients = dict(Client.objects.filter(is_active=True).values_list('user__username', 'user_id'))
+        self.warehouses = {
+            (client_id, name): warehouse_id
+            for warehouse_id, client_id, name in Warehouse.objects.filter(is_active=True).values_list('id', 'client_id', 'name')
+        }
+        self.warehouse_clients = {warehouse_id: client_id for (client_id, _), warehouse_id in self.warehouses.items()}
+
+    def resolve_warehouse(self, row):
+        username, name = row['username'], row['warehouse']
+        client_id = self.clients.get(username)
+        if client_id is None:
+            user = CustomUser.objects.filter(username=username).first()
+            if user is None:
+                user = CustomUser.objects.create_user(username=username, password=None)
+            client, _ = Client.objects.get_or_create(user=user)
+            if not client.is_active:
+                raise CommandError(f"Client {username} is inactive.")
+            client_id = self.clients[username] = client.user_id
+        warehouse_id = self.warehouses.get((client_id, name))
+        if warehouse_id is None:
+            warehouse = Warehouse.objects.create(client_id=client_id, name=name, address=row.get('address') or '')
+            warehouse_id = self.warehouses[(client_id, name)] = warehouse.id
+            self.warehouse_clients[warehouse_id] = client_id
+        return warehouse_id
+
+    def build_record(self, row, line):
+        try:
+            type_record = row['type_record']
+            if type_record not in ('IN', 'OUT'):
+                raise ValueError(f"unknown type_record {type_record!r}")
+            created_at = timezone.now()
+            if row.get('created_at'):
+                created_at = datetime.fromisoformat(row['created_at'])
+                if timezone.is_naive(created_at):
+                    created_at = timezone.make_aware(created_at)
+            return RecordsModel(warehouse_id=self.resolve_warehouse(row), type_record=type_record,
+                                quantity=int(row['quantity']), created_at=created_at, updated_at=created_at)
+        except (KeyError, TypeError, ValueError) as e:
+            raise CommandError(f"Row {line}: {e}")
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        input_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        chunk_size = options['chunk_size']
+
+        checkpoint, _ = LedgerImport.objects.get_or_create(source=path)
+        if options['restart']:
+            checkpoint.rows_committed = 0
+            checkpoint.save()
+        skipped = checkpoint.rows_committed
+        if skipped:
+            self.stdout.write(f"Resuming after {skipped} committed row(s).")
+
+        self.load_lookups()
+        rows = islice(self.read_rows(path, input_format), skipped, None)
+        started = time.monotonic()
+        imported = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                records = [self.build_record(row, skipped + imported + index + 1) for index, row in enumerate(chunk)]
+                bulk_create_keeping_created_at(RecordsModel, records, batch_size=500)
+                add_records_aggregates(records)
+                bump_client_versions(*{self.warehouse_clients[record.warehouse_id] for record in records})
+                imported += len(records)
+                LedgerImport.objects.filter(pk=checkpoint.pk).update(
+                    rows_committed=skipped + imported, updated_at=timezone.now())
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"{skipped + imported} row(s) committed, {imported / elapsed:.0f} rows/sec")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} row(s) from {path}."))
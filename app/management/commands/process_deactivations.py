@@ -0,0 +1,29 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app.models import DeactivationJob
+
+
+class Command(BaseCommand):
+    help = ("Runs the queued client/warehouse deactivations in batches of short transactions. "
+            "Run it from cron, or keep it running as the local worker with --every.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.DEACTIVATION_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches, leaving the write lock to other writers.")
+        parser.add_argument('--every', type=int, help="Poll the queue every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            while True:
+                job = DeactivationJob.claim_next(settings.DEACTIVATION_STALE_SECONDS)
+                if job is None:
+                    break
+                job.run(options['batch_size'], pause=options['pause'])
+                self.stdout.write(
+                    f"Deactivation {job.pk} ({job.client_id or job.warehouse_id}): {job.status}, "
+                    f"{job.records_done} record(s), {job.warehouses_done} warehouse(s).")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
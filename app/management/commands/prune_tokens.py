@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired outstanding refresh tokens, and their blacklist entries, in small batches. "
+            "Run it from cron, or keep it running with --every.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--every', type=int, help="Repeat the pruning every N seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = self.prune(options['batch_size'])
+            self.stdout.write(f"Pruned {deleted} expired token(s).")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def prune(self, batch_size):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(OutstandingToken.objects.filter(expires_at__lt=now)
+                           .order_by('id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    return deleted
+                # BlacklistedToken rows go with them through the CASCADE
+                OutstandingToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Sum
+from app.models import RecordsModel, StockBalance, Warehouse
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-warehouse stock balances from the records ledger and reports any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only verify the stored balances, exit with an error if any of them drifted.")
+
+    def ledger_balances(self):
+        balances = {}
+        rows = (RecordsModel.objects.filter(is_active=True, warehouse__is_active=True)
+                .values('warehouse_id', 'type_record')
+                .annotate(total=Sum('quantity'), last=Max('created_at'))
+                .order_by())
+        for row in rows:
+            balance = balances.setdefault(row['warehouse_id'], StockBalance(warehouse_id=row['warehouse_id']))
+            if row['type_record'] == 'IN':
+                balance.total_in = row['total']
+            elif row['type_record'] == 'OUT':
+                balance.total_out = row['total']
+            else:
+                continue
+            if balance.last_movement_at is None or row['last'] > balance.last_movement_at:
+                balance.last_movement_at = row['last']
+        return balances
+
+    def handle(self, *args, **options):
+        expected = self.ledger_balances()
+        for warehouse_id in Warehouse.objects.exclude(id__in=expected.keys()).values_list('id', flat=True):
+            expected[warehouse_id] = StockBalance(warehouse_id=warehouse_id)
+        stored = StockBalance.objects.in_bulk()
+
+        drifted = []
+        for warehouse_id, balance in expected.items():
+            current = stored.get(warehouse_id) or StockBalance(warehouse_id=warehouse_id)
+            if (current.total_in, current.total_out, current.last_movement_at) != \
+                    (balance.total_in, balance.total_out, balance.last_movement_at):
+                drifted.append(balance)
+                self.stdout.write(f"{warehouse_id}: stored in={current.total_in} out={current.total_out}, "
+                                  f"ledger in={balance.total_in} out={balance.total_out}")
+
+        if options['check']:
+            if drifted:
+                raise CommandError(f"{len(drifted)} warehouse balance(s) drifted from the ledger.")
+            self.stdout.write(self.style.SUCCESS(f"{len(expected)} warehouse balance(s) match the ledger."))
+            return
+
+        with transaction.atomic():
+            StockBalance.objects.bulk_create(
+                drifted, batch_size=500, update_conflicts=True, unique_fields=['warehouse'],
+                update_fields=['total_in', 'total_out', 'last_movement_at'],
+            )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drifted)} of {len(expected)} warehouse balance(s)."))
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app.write_buffer import record_buffer
+
+
+class Command(BaseCommand):
+    help = ("Commits the records left in RECORDS_WRITE_BUFFER_DIR by worker processes that exited "
+            "before flushing them. Records already committed are skipped, so it is safe to run at every "
+            "start; running workers also replay these segments on their own.")
+
+    def handle(self, *args, **options):
+        inserted = record_buffer.replay_orphans()
+        self.stdout.write(f"Replayed {inserted} records from {settings.RECORDS_WRITE_BUFFER_DIR}.")
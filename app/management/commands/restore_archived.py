@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from app.archive import restore_archived
+
+
+class Command(BaseCommand):
+    help = ("Moves archived rows back to the hot tables, still inactive: a client with its warehouses and "
+            "records, a warehouse with its records, or one record.")
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--client', help="Client (user) id.")
+        target.add_argument('--warehouse', help="Warehouse id.")
+        target.add_argument('--record', help="Record id.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        restored = restore_archived(client_id=options['client'], warehouse_id=options['warehouse'],
+                                    record_id=options['record'], batch_size=options['batch_size'])
+        self.stdout.write(f"Restored {restored['RecordsModel']} record(s), {restored['Warehouse']} warehouse(s) "
+                          f"and {restored['Client']} client(s).")
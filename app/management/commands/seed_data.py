@@ -0,0 +1,69 @@
+import random
+import uuid
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from utils.cache import bump_client_versions
+from app.models import (Client, CustomUser, RecordsModel, Warehouse, add_records_aggregates,
+                        bulk_create_keeping_created_at)
+
+
+def seed_data(clients, warehouses_per_client, records_per_warehouse, days=30, password='password',
+              batch_size=1000, rng=None):
+    """
+    Creates synthetic clients, warehouses and records with bulk_create, keeping the
+    stock balances and movement rollups in step. Records are spread over the last
+    `days` days. Every user gets the same password, hashed once.
+    :return: The created clients.
+    """
+    rng = rng or random.Random()
+    run = uuid.uuid4().hex[:8]
+    now = timezone.now()
+    password = make_password(password)
+
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(username=f'seed-{run}-{index}', password=password) for index in range(clients)],
+        batch_size=batch_size)
+    created = Client.objects.bulk_create([Client(user=user) for user in users], batch_size=batch_size)
+    warehouses = Warehouse.objects.bulk_create(
+        [Warehouse(name=f'{client.user.username}-{index}', address=f'{index} Seed street', client=client)
+         for client in created for index in range(warehouses_per_client)], batch_size=batch_size)
+
+    per_chunk = max(1, batch_size // max(1, records_per_warehouse))
+    for start in range(0, len(warehouses), per_chunk):
+        records = [
+            RecordsModel(warehouse=warehouse, type_record=rng.choice(('IN', 'IN', 'OUT')),
+                         quantity=rng.randint(1, 100),
+                         created_at=now - timedelta(seconds=rng.randint(0, days * 86400)))
+            for warehouse in warehouses[start:start + per_chunk] for _ in range(records_per_warehouse)
+        ]
+        bulk_create_keeping_created_at(RecordsModel, records, batch_size=batch_size)
+        add_records_aggregates(records)
+    # bulk_create sends no signals, staff listings span the new clients
+    bump_client_versions()
+    return created
+
+
+class Command(BaseCommand):
+    help = ("Generates synthetic clients, warehouses and records with bulk_create, "
+            "with their stock balances and movement rollups.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10)
+        parser.add_argument('--warehouses-per-client', type=int, default=5)
+        parser.add_argument('--records-per-warehouse', type=int, default=100)
+        parser.add_argument('--days', type=int, default=30, help="Records are spread over the last N days.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, help="Random seed, for reproducible quantities and dates.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            clients = seed_data(options['clients'], options['warehouses_per_client'], options['records_per_warehouse'],
+                                days=options['days'], password=options['password'], batch_size=options['batch_size'],
+                                rng=random.Random(options['seed']))
+        warehouses = len(clients) * options['warehouses_per_client']
+        self.stdout.write(f"Created {len(clients)} client(s), {warehouses} warehouse(s) and "
+                          f"{warehouses * options['records_per_warehouse']} record(s).")
@@ -0,0 +1,79 @@
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+ORDERINGS = {
+    'total': lambda group: group['total_ms'],
+    'count': lambda group: group['count'],
+    'max': lambda group: group['max_ms'],
+}
+
+
+def read_entries(path, backups):
+    """Yields the entries of the slow query log and of its rotated files, skipping torn lines."""
+    for suffix in [f'.{index}' for index in range(backups, 0, -1)] + ['']:
+        if not os.path.exists(path + suffix):
+            continue
+        with open(path + suffix, encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def group_entries(entries):
+    """
+    :return: One dict per fingerprint with its count, total and max duration, the views
+             that ran it and the plan of its slowest run.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.get(entry['fingerprint'])
+        if group is None:
+            group = groups[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'], 'sql': entry['sql'], 'count': 0, 'total_ms': 0.0,
+                'max_ms': 0.0, 'views': {}, 'plan': None, 'last_seen': None,
+            }
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        view = entry.get('view') or '-'
+        group['views'][view] = group['views'].get(view, 0) + 1
+        if entry['duration_ms'] >= group['max_ms']:
+            group['max_ms'], group['plan'] = entry['duration_ms'], entry.get('plan')
+        group['last_seen'] = max(group['last_seen'] or entry['time'], entry['time'])
+    return list(groups.values())
+
+
+class Command(BaseCommand):
+    help = ("Groups the slow query log (SLOW_QUERY_LOG_FILE and its rotated files) by SQL fingerprint "
+            "and reports the count, total and max time, calling views and query plan of each.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help="Log to read, defaults to SLOW_QUERY_LOG_FILE.")
+        parser.add_argument('--order-by', choices=sorted(ORDERINGS), default='total')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help="Write the groups as JSON.")
+
+    def handle(self, *args, **options):
+        path = options['file'] or str(settings.SLOW_QUERY_LOG_FILE)
+        if not os.path.exists(path) and not os.path.exists(path + '.1'):
+            raise CommandError(f"No slow query log at {path}.")
+        groups = group_entries(read_entries(path, settings.SLOW_QUERY_LOG_BACKUP_COUNT))
+        groups.sort(key=ORDERINGS[options['order_by']], reverse=True)
+        groups = groups[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(groups, indent=2))
+            return
+        for group in groups:
+            views = ', '.join(f'{view} x{count}' for view, count in
+                              sorted(group['views'].items(), key=lambda item: -item[1]))
+            self.stdout.write(f"{group['fingerprint']}  {group['count']} run(s), {group['total_ms']:.1f} ms total, "
+                              f"{group['max_ms']:.1f} ms max, last {group['last_seen']}")
+            self.stdout.write(f"  views: {views}")
+            self.stdout.write(f"  sql:   {group['sql']}")
+            for line in group['plan'] or []:
+                self.stdout.write(f"  plan:  {line}")
+            self.stdout.write('')
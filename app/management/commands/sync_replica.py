@@ -0,0 +1,24 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from utils.replica import sync_replica
+
+
+class Command(BaseCommand):
+    help = ("Copies the primary database to DATABASE_REPLICA_NAME with the SQLite online backup API. "
+            "Keep it running with --every, well below DATABASE_REPLICA_MAX_LAG, for the read actions to use "
+            "the replica.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help="Sync again every N seconds.")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICA_NAME:
+            raise CommandError("Set DATABASE_REPLICA_NAME to the path of the replica file.")
+        while True:
+            started = time.time()
+            sync_replica()
+            self.stdout.write(f"Synced {settings.DATABASE_REPLICA_NAME} in {time.time() - started:.3f}s.")
+            if not options['every']:
+                break
+            time.sleep(max(0, options['every'] - (time.time() - started)))
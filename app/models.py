@@ -1,6 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+import time
 import uuid
+from datetime import timedelta
 
 class ActivityTrackModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -24,34 +28,377 @@ class Client(ActivityTrackModel):
     def username(self):
         return self.user.username
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'user'], condition=models.Q(is_active=True), name='client_active_created_idx'),
+            models.Index(fields=['updated_at', 'user'], name='client_updated_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
 
     def save(self, *args, **kwargs):
-        if not self.is_active:
-            Warehouse.objects.filter(client=self).update(is_active=False)
-            RecordsModel.objects.filter(warehouse__client=self).update(is_active=False)
         super().save(*args, **kwargs)
+        if not self.is_active:
+            # Reads hide the warehouses and records of an inactive client right away,
+            # the process_deactivations worker flips their rows in batches.
+            DeactivationJob.enqueue(client=self)
 
 class Warehouse(ActivityTrackModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     name = models.CharField(max_length=255)
     address = models.CharField(max_length=255)
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='warehouses')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True), name='warehouse_active_created_idx'),
+            models.Index(fields=['client', 'created_at'], condition=models.Q(is_active=True), name='warehouse_client_active_idx'),
+            models.Index(fields=['updated_at', 'id'], name='warehouse_updated_idx'),
+        ]
     
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
-        if not self.is_active:
-            RecordsModel.objects.filter(warehouse=self).update(is_active=False)
         super().save(*args, **kwargs)
+        if not self.is_active:
+            DeactivationJob.enqueue(warehouse=self)
 
 class RecordsModel(ActivityTrackModel):
     id_record = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
     warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name="records")
     type_record = models.CharField(max_length=10, choices=[("IN", "ENTRY"), ("OUT", "EXIT")])
     quantity = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id_record'], condition=models.Q(is_active=True), name='record_active_created_idx'),
+            models.Index(fields=['warehouse', 'created_at'], condition=models.Q(is_active=True), name='record_warehouse_active_idx'),
+            models.Index(fields=['updated_at', 'id_record'], name='record_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.warehouse.address} - {self.id_record}"
+
+class StockBalance(models.Model):
+    warehouse = models.OneToOneField(Warehouse, on_delete=models.CASCADE, primary_key=True, related_name='stock')
+    total_in = models.BigIntegerField(default=0)
+    total_out = models.BigIntegerField(default=0)
+    last_movement_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def net(self):
+        return self.total_in - self.total_out
+
+    def __str__(self):
+        return f"{self.warehouse_id} - {self.net}"
+
+    @classmethod
+    def apply_record(cls, record, sign=1, warehouse_id=None):
+        """
+        Adds (sign=1) or removes (sign=-1) a record from its warehouse balance.
+        Must run inside the transaction that writes the record.
+        """
+        warehouse_id = warehouse_id or record.warehouse_id
+        field = {'IN': 'total_in', 'OUT': 'total_out'}.get(record.type_record)
+        if field is None:
+            return
+        cls.objects.get_or_create(warehouse_id=warehouse_id)
+        changes = {field: models.F(field) + sign * record.quantity}
+        if sign > 0:
+            changes['last_movement_at'] = Coalesce(
+                Greatest('last_movement_at', models.Value(record.created_at)), models.Value(record.created_at))
+        else:
+            changes['last_movement_at'] = models.Subquery(
+                RecordsModel.objects.filter(warehouse_id=warehouse_id, is_active=True)
+                .exclude(pk=record.pk).order_by('-created_at').values('created_at')[:1])
+        cls.objects.filter(warehouse_id=warehouse_id).update(**changes)
+
+    @classmethod
+    def add_records(cls, records):
+        """
+        Bulk counterpart of apply_record for freshly created records:
+        one UPDATE per warehouse instead of one per record.
+        """
+        totals = {}
+        for record in records:
+            if record.type_record not in ('IN', 'OUT'):
+                continue
+            total = totals.setdefault(record.warehouse_id, {'IN': 0, 'OUT': 0, 'last': record.created_at})
+            total[record.type_record] += record.quantity
+            total['last'] = max(total['last'], record.created_at)
+        cls.objects.bulk_create([cls(warehouse_id=warehouse_id) for warehouse_id in totals], ignore_conflicts=True)
+        for warehouse_id, total in totals.items():
+            last = models.Value(total['last'])
+            cls.objects.filter(warehouse_id=warehouse_id).update(
+                total_in=models.F('total_in') + total['IN'],
+                total_out=models.F('total_out') + total['OUT'],
+                last_movement_at=Coalesce(Greatest('last_movement_at', last), last),
+            )
+
+    @classmethod
+    def reset(cls, warehouses):
+        cls.objects.filter(warehouse__in=warehouses).update(total_in=0, total_out=0, last_movement_at=None)
+
+class MovementRollup(models.Model):
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, related_name='rollups')
+    bucket = models.DateTimeField()
+    type_record = models.CharField(max_length=10, choices=[("IN", "ENTRY"), ("OUT", "EXIT")])
+    total_quantity = models.BigIntegerField(default=0)
+    record_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'bucket', 'type_record'], name='unique_movement_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket', 'warehouse'], name='rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse_id} - {self.bucket:%Y-%m-%d %H:00} - {self.type_record}"
+
+    @staticmethod
+    def bucket_for(moment):
+        return moment.replace(minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def apply_record(cls, record, sign=1, warehouse_id=None):
+        """
+        Adds (sign=1) or removes (sign=-1) a record from its hourly bucket.
+        Must run inside the transaction that writes the record.
+        """
+        if record.type_record not in ('IN', 'OUT'):
+            return
+        key = {
+            'warehouse_id': warehouse_id or record.warehouse_id,
+            'bucket': cls.bucket_for(record.created_at),
+            'type_record': record.type_record,
+        }
+        cls.objects.get_or_create(**key)
+        cls.objects.filter(**key).update(
+            total_quantity=models.F('total_quantity') + sign * record.quantity,
+            record_count=models.F('record_count') + sign,
+        )
+
+    @classmethod
+    def add_records(cls, records):
+        """
+        Bulk counterpart of apply_record for freshly created records:
+        one UPDATE per bucket instead of one per record.
+        """
+        totals = {}
+        for record in records:
+            if record.type_record not in ('IN', 'OUT'):
+                continue
+            key = (record.warehouse_id, cls.bucket_for(record.created_at), record.type_record)
+            quantity, count = totals.get(key, (0, 0))
+            totals[key] = (quantity + record.quantity, count + 1)
+        cls.objects.bulk_create([cls(warehouse_id=warehouse_id, bucket=bucket, type_record=type_record)
+                                 for warehouse_id, bucket, type_record in totals], ignore_conflicts=True)
+        for (warehouse_id, bucket, type_record), (quantity, count) in totals.items():
+            cls.objects.filter(warehouse_id=warehouse_id, bucket=bucket, type_record=type_record).update(
+                total_quantity=models.F('total_quantity') + quantity,
+                record_count=models.F('record_count') + count,
+            )
+
+
+def apply_record_aggregates(record, sign=1, warehouse_id=None):
+    StockBalance.apply_record(record, sign=sign, warehouse_id=warehouse_id)
+    MovementRollup.apply_record(record, sign=sign, warehouse_id=warehouse_id)
+
+
+def add_records_aggregates(records):
+    StockBalance.add_records(records)
+    MovementRollup.add_records(records)
+
+
+def bulk_create_keeping_created_at(model, objs, batch_size=None):
+    """
+    bulk_create storing the created_at of the instances rather than the insert time.
+    auto_now_add stamps the insert, so the times are written back in the same transaction;
+    toggling the shared field instead would affect the rows other threads create meanwhile.
+    :return: The created instances.
+    """
+    created_at = [obj.created_at for obj in objs]
+    with transaction.atomic():
+        objs = model.objects.bulk_create(objs, batch_size=batch_size)
+        for obj, value in zip(objs, created_at):
+            obj.created_at = value
+        model.objects.bulk_update(objs, ['created_at'], batch_size=batch_size)
+    return objs
+
+class LedgerImport(models.Model):
+    source = models.CharField(max_length=1024, unique=True)
+    rows_committed = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} - {self.rows_committed}"
+
+class DeactivationJob(models.Model):
+    """
+    Deactivation of the warehouses and records below an inactive client or
+    warehouse. process_deactivations runs it in batches of short transactions,
+    so a large client never holds the SQLite write lock for long; the committed
+    counters double as progress.
+    """
+    PENDING, RUNNING, DONE, CANCELLED, FAILED = 'pending', 'running', 'done', 'cancelled', 'failed'
+    OPEN_STATUSES = (PENDING, RUNNING)
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='deactivation_jobs')
+    warehouse = models.ForeignKey(Warehouse, on_delete=models.CASCADE, null=True, blank=True, related_name='deactivation_jobs')
+    status = models.CharField(max_length=10, default=PENDING, choices=[
+        (PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (CANCELLED, "Cancelled"), (FAILED, "Failed")])
+    records_total = models.BigIntegerField(default=0)
+    records_done = models.BigIntegerField(default=0)
+    warehouses_done = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='deactivation_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client_id or self.warehouse_id} - {self.status}"
+
+    @classmethod
+    def enqueue(cls, client=None, warehouse=None):
+        target = {'client': client} if client is not None else {'warehouse': warehouse}
+        job = cls.objects.filter(status__in=cls.OPEN_STATUSES, **target).first()
+        return job or cls.objects.create(**target)
+
+    @classmethod
+    def claim_next(cls, stale_after):
+        """
+        Marks the oldest pending job, or a running job whose worker stopped
+        reporting progress for stale_after seconds, as running.
+        :return: The claimed job or None.
+        """
+        stale = timezone.now() - timedelta(seconds=stale_after)
+        candidates = cls.objects.filter(
+            models.Q(status=cls.PENDING) | models.Q(status=cls.RUNNING, updated_at__lt=stale)).order_by('created_at')
+        for job in candidates[:10]:
+            claimed = cls.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+                status=cls.RUNNING, started_at=job.started_at or timezone.now(), updated_at=timezone.now())
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    def warehouse_ids(self):
+        if self.client_id:
+            return list(Warehouse.objects.filter(client_id=self.client_id).values_list('id', flat=True))
+        return [self.warehouse_id]
+
+    def target_is_active(self):
+        if self.client_id:
+            return Client.objects.filter(pk=self.client_id, is_active=True).exists()
+        return Warehouse.objects.filter(pk=self.warehouse_id, is_active=True).exists()
+
+    def run(self, batch_size, pause=0):
+        """
+        Deactivates the records, then the warehouses, of the target. Every batch
+        commits with the progress counters, so a restarted job resumes where the
+        previous run stopped. A target reactivated meanwhile cancels the job.
+        """
+        warehouse_ids = self.warehouse_ids()
+        self.records_total = self.records_done + RecordsModel.objects.filter(
+            warehouse_id__in=warehouse_ids, is_active=True).count()
+        self.save(update_fields=['records_total', 'updated_at'])
+        batches = [(RecordsModel, {'warehouse_id': warehouse_id}, 'records_done') for warehouse_id in warehouse_ids]
+        if self.client_id:
+            batches.append((Warehouse, {'client_id': self.client_id}, 'warehouses_done'))
+        try:
+            for model, filters, counter in batches:
+                while True:
+                    if self.target_is_active():
+                        return self.finish(self.CANCELLED)
+                    # Flipped rows leave the partial index, so the next batch is always at its head.
+                    ids = list(model.objects.filter(is_active=True, **filters)
+                               .order_by('created_at').values_list('pk', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    with transaction.atomic():
+                        # .update() skips auto_now, the change feed relies on updated_at moving
+                        model.objects.filter(pk__in=ids).update(is_active=False, updated_at=timezone.now())
+                        setattr(self, counter, getattr(self, counter) + len(ids))
+                        self.save(update_fields=[counter, 'updated_at'])
+                    if pause:
+                        time.sleep(pause)
+            with transaction.atomic():
+                StockBalance.reset(warehouse_ids)
+                MovementRollup.objects.filter(warehouse_id__in=warehouse_ids).delete()
+                self.finish(self.DONE)
+        except Exception as e:
+            self.finish(self.FAILED, error=str(e))
+            raise
+
+    def finish(self, status, error=''):
+        self.status, self.error, self.finished_at = status, error, timezone.now()
+        self.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+
+class ArchiveModel(models.Model):
+    """
+    Copy of an inactive row moved out of its hot table by archive_inactive.
+    The foreign keys are plain ids, so archived rows hold no constraint on live data;
+    client_id scopes them for the sync feed and for restores.
+    """
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    is_active = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+class ArchivedClient(ArchiveModel):
+    user_id = models.UUIDField(primary_key=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='archived_client_updated_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.user_id)
+
+class ArchivedWarehouse(ArchiveModel):
+    id = models.UUIDField(primary_key=True)
+    name = models.CharField(max_length=255)
+    address = models.CharField(max_length=255)
+    client_id = models.UUIDField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['client_id', 'updated_at'], name='archived_warehouse_client_idx'),
+            models.Index(fields=['updated_at'], name='archived_warehouse_updated_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class ArchivedRecord(ArchiveModel):
+    id_record = models.UUIDField(primary_key=True)
+    warehouse_id = models.UUIDField()
+    client_id = models.UUIDField()
+    type_record = models.CharField(max_length=10, choices=[("IN", "ENTRY"), ("OUT", "EXIT")])
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['warehouse_id'], name='archived_record_warehouse_idx'),
+            models.Index(fields=['client_id', 'updated_at'], name='archived_record_client_idx'),
+            models.Index(fields=['updated_at'], name='archived_record_updated_idx'),
+        ]
+
+    def __str__(self):
+        return str(self.id_record)
@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Client, Warehouse,RecordsModel
+from .models import Client, Warehouse,RecordsModel, StockBalance, DeactivationJob
 from django.contrib.auth import get_user_model
+from utils.serializers import DynamicFieldsMixin
 
 CustomUser = get_user_model()
  
@@ -45,8 +46,8 @@ class RegisterResponseSerializer(serializers.ModelSerializer):
 
 
 ###  Client
-class ClientSerializer(serializers.ModelSerializer):
-    id_client = serializers.UUIDField(source='user.id', read_only=True)
+class ClientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    id_client = serializers.UUIDField(source='user_id', read_only=True)
     warehouses = serializers.SerializerMethodField()
     username = serializers.CharField(source='user.username', read_only=True)
     is_active = serializers.BooleanField(read_only=True)
@@ -57,10 +58,14 @@ class ClientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Client
         fields = ['id_client', 'username', 'warehouses', 'is_active', 'created_at', 'updated_at']
+        expandable_fields = ['warehouses']
 
     def get_warehouses(self, obj):
-        warehouses = obj.warehouses.filter(is_active=True)
-        return WarehouseSerializer(warehouses, many=True).data
+        warehouses = getattr(obj, 'active_warehouses', None)
+        if warehouses is None:
+            warehouses = obj.warehouses.filter(is_active=True)
+        context = {'expand': self.context.get('expand')}
+        return WarehouseSerializer(warehouses, many=True, context=context).data
 
     def update(self, instance, validated_data):
         user_data = validated_data.pop('user', None)
@@ -78,7 +83,7 @@ class ClientSerializer(serializers.ModelSerializer):
 
 ### records 
 
-class RecordsSerializer(serializers.ModelSerializer):
+class RecordsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     id_record = serializers.UUIDField(read_only=True)
     id_warehouse = serializers.PrimaryKeyRelatedField(source='warehouse', queryset=Warehouse.objects.all())
     type_record = serializers.CharField(max_length=10)
@@ -94,10 +99,108 @@ class RecordsSerializer(serializers.ModelSerializer):
             validated_data.pop('type_record')
         return super().update(instance, validated_data)
 
+class RecordsBulkItemSerializer(serializers.Serializer):
+    id_warehouse = serializers.UUIDField()
+    type_record = serializers.ChoiceField(choices=['IN', 'OUT'])
+    quantity = serializers.IntegerField()
+
+class RecordsBulkResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['created', 'error'])
+    id_record = serializers.UUIDField(required=False)
+    errors = serializers.DictField(required=False)
+
+class RecordsExportRequestSerializer(serializers.Serializer):
+    id_warehouse = serializers.UUIDField(required=False)
+    id_client = serializers.UUIDField(required=False)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+
+#### Stock
+
+class StockBalanceSerializer(serializers.ModelSerializer):
+    id_warehouse = serializers.UUIDField(source='warehouse_id', read_only=True)
+    net = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StockBalance
+        fields = ['id_warehouse', 'total_in', 'total_out', 'net', 'last_movement_at']
+
+
+#### Reports
+
+class MovementReportRequestSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
+    granularity = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    group_by = serializers.ChoiceField(choices=['warehouse', 'client'], default='warehouse')
+    id_warehouse = serializers.UUIDField(required=False)
+    id_client = serializers.UUIDField(required=False)
+
+    def validate(self, attrs):
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError({"end": "The end of the range must be after its start."})
+        return attrs
+
+class MovementReportSerializer(serializers.Serializer):
+    bucket = serializers.DateTimeField()
+    id_warehouse = serializers.UUIDField(required=False)
+    id_client = serializers.UUIDField(required=False)
+    type_record = serializers.CharField()
+    total_quantity = serializers.IntegerField()
+    record_count = serializers.IntegerField()
+
+
+#### Sync
+
+class SyncClientSerializer(serializers.ModelSerializer):
+    id_client = serializers.UUIDField(source='user_id', read_only=True)
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Client
+        fields = ['id_client', 'username', 'is_active', 'created_at', 'updated_at']
+
+class SyncWarehouseSerializer(serializers.ModelSerializer):
+    id_warehouse = serializers.UUIDField(source='id', read_only=True)
+    id_client = serializers.UUIDField(source='client_id', read_only=True)
+
+    class Meta:
+        model = Warehouse
+        fields = ['id_warehouse', 'name', 'address', 'id_client', 'is_active', 'created_at', 'updated_at']
+
+class SyncRequestSerializer(serializers.Serializer):
+    since = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+class SyncResponseSerializer(serializers.Serializer):
+    cursor = serializers.CharField()
+    has_more = serializers.BooleanField()
+    clients = SyncClientSerializer(many=True)
+    warehouses = SyncWarehouseSerializer(many=True)
+    records = RecordsSerializer(many=True)
+
+
+#### Deactivations
+
+class DeactivationJobFilterSerializer(serializers.Serializer):
+    id_client = serializers.UUIDField(required=False)
+    id_warehouse = serializers.UUIDField(required=False)
+
+class DeactivationJobSerializer(serializers.ModelSerializer):
+    id_client = serializers.UUIDField(source='client_id', read_only=True)
+    id_warehouse = serializers.UUIDField(source='warehouse_id', read_only=True)
+
+    class Meta:
+        model = DeactivationJob
+        fields = ['id', 'id_client', 'id_warehouse', 'status', 'records_total', 'records_done', 'warehouses_done',
+                  'error', 'created_at', 'started_at', 'finished_at', 'updated_at']
+
 
 #### Warehouse
 
-class WarehouseSerializer(serializers.ModelSerializer):
+class WarehouseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='client.user.username', read_only=True)
     id_client = serializers.UUIDField(source='client.id', required=True)
     id_warehouse = serializers.UUIDField(source='id', read_only=True)
@@ -105,14 +208,27 @@ class WarehouseSerializer(serializers.ModelSerializer):
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     records = serializers.SerializerMethodField()
+    stock = serializers.SerializerMethodField()
 
     class Meta:
         model = Warehouse
-        fields = ['id_warehouse', 'name', 'address', 'id_client', 'username', 'is_active', 'created_at', 'updated_at', 'records']
+        fields = ['id_warehouse', 'name', 'address', 'id_client', 'username', 'is_active', 'created_at', 'updated_at', 'records', 'stock']
+        expandable_fields = ['records', 'stock']
+        # Client.id is a property returning the user id, which is the client pk
+        value_columns = {'id_client': 'client_id'}
+
+    def get_stock(self, obj):
+        try:
+            balance = obj.stock
+        except StockBalance.DoesNotExist:
+            balance = StockBalance(warehouse=obj)
+        return StockBalanceSerializer(balance).data
 
     def get_records(self, obj):
         if isinstance(obj, Warehouse):
-            records = obj.records.filter(is_active=True)
+            records = getattr(obj, 'active_records', None)
+            if records is None:
+                records = obj.records.filter(is_active=True)
             return RecordsSerializer(records, many=True).data
         return []
 
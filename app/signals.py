@@ -0,0 +1,45 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from utils.authentication import invalidate_user_snapshot
+from utils.cache import bump_client_versions
+from utils.tokens import blacklist_filter
+from .models import Client, CustomUser, RecordsModel, Warehouse
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_user_snapshot_on_user_save(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=Client)
+def invalidate_user_snapshot_on_client_save(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.user_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_to_blacklist_filter(sender, instance, created, **kwargs):
+    if created:
+        blacklist_filter.add(instance.token.jti)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=Client)
+def bump_client_versions_on_client_change(sender, instance, **kwargs):
+    # Reads of an inactive client's warehouses and records filter on the client flag, so this bump
+    # also covers the rows process_deactivations flips later with .update()
+    bump_client_versions(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Warehouse)
+def bump_client_versions_on_warehouse_change(sender, instance, **kwargs):
+    bump_client_versions(instance.client_id)
+
+
+@receiver([post_save, post_delete], sender=RecordsModel)
+def bump_client_versions_on_record_change(sender, instance, **kwargs):
+    if RecordsModel.warehouse.is_cached(instance):
+        client_id = instance.warehouse.client_id
+    else:
+        client_id = Warehouse.objects.filter(pk=instance.warehouse_id).values_list('client_id', flat=True).first()
+    bump_client_versions(client_id)
@@ -0,0 +1,122 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import ArchivedClient, ArchivedRecord, ArchivedWarehouse, Client, RecordsModel, Warehouse
+from .serializers import RecordsSerializer, SyncClientSerializer, SyncWarehouseSerializer
+
+# feed name -> (model, primary key field, id key of the output, serializer)
+SYNC_FEEDS = {
+    'clients': (Client, 'user_id', 'id_client', SyncClientSerializer),
+    'warehouses': (Warehouse, 'id', 'id_warehouse', SyncWarehouseSerializer),
+    'records': (RecordsModel, 'id_record', 'id_record', RecordsSerializer),
+}
+
+# feed name -> (archive model, client id field), see app.archive
+SYNC_ARCHIVES = {
+    'clients': (ArchivedClient, 'user_id'),
+    'warehouses': (ArchivedWarehouse, 'client_id'),
+    'records': (ArchivedRecord, 'client_id'),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(positions, issued_at):
+    payload = {name: [updated_at.isoformat(), str(pk)] for name, (updated_at, pk) in positions.items() if updated_at}
+    payload['issued_at'] = issued_at.isoformat()
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    :return: (positions, issued_at), issued_at is None for cursors issued before it was recorded.
+    """
+    if not cursor:
+        return {}, None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        positions = {name: (datetime.fromisoformat(payload[name][0]), payload[name][1])
+                     for name in SYNC_FEEDS if name in payload}
+        issued_at = payload.get('issued_at')
+        return positions, issued_at and datetime.fromisoformat(issued_at)
+    except (ValueError, TypeError, AttributeError):
+        raise InvalidCursor("Invalid sync cursor.")
+
+
+def scoped_queryset(name, user):
+    model = SYNC_FEEDS[name][0]
+    if user.is_staff:
+        return model.objects.all()
+    if name == 'clients':
+        return model.objects.filter(user=user)
+    if name == 'warehouses':
+        return model.objects.filter(client_id=user.pk)
+    return model.objects.filter(warehouse__client_id=user.pk)
+
+
+def missed_archived_tombstones(name, user, updated_at, issued_at):
+    """
+    Whether rows the cursor had not reached yet were archived after it was issued,
+    taking their tombstones with them. Rows archived earlier were checked when the
+    client asked for this cursor.
+    """
+    archive_model, client_field = SYNC_ARCHIVES[name]
+    archived = archive_model.objects.filter(updated_at__gte=updated_at)
+    if issued_at is not None:
+        archived = archived.filter(archived_at__gte=issued_at)
+    if not user.is_staff:
+        archived = archived.filter(**{client_field: user.pk})
+    return archived.exists()
+
+
+def settle_seconds():
+    """
+    :return: How far behind now the feed stops. updated_at is stamped before the
+             statement that writes it, which can wait up to SQLITE_BUSY_TIMEOUT on the
+             write lock, and the transaction may run SYNC_SETTLE_SECONDS more before it
+             commits; a row committed later than that could land behind a returned cursor.
+    """
+    return settings.SQLITE_TUNING['BUSY_TIMEOUT'] / 1000 + settings.SYNC_SETTLE_SECONDS
+
+
+def changes_since(user, cursor, limit):
+    """
+    Rows of every feed whose (updated_at, pk) moved past the cursor position,
+    up to the settle_seconds() horizon so that transactions still in flight
+    cannot commit behind the returned cursor.
+    Inactive rows are returned as tombstones. A cursor behind rows archived since
+    it was issued is rejected, the client has to sync again from scratch.
+    """
+    issued_at = timezone.now()
+    positions, previous_issued_at = decode_cursor(cursor)
+    for name, (updated_at, _) in positions.items():
+        if missed_archived_tombstones(name, user, updated_at, previous_issued_at):
+            raise InvalidCursor("The sync cursor predates archived deletions, sync again without a cursor.")
+    horizon = timezone.now() - timedelta(seconds=settle_seconds())
+    data = {'has_more': False}
+    for name, (model, pk_field, id_key, serializer_class) in SYNC_FEEDS.items():
+        rows = scoped_queryset(name, user).filter(updated_at__lte=horizon)
+        if name in positions:
+            updated_at, pk = positions[name]
+            rows = rows.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, **{f'{pk_field}__gt': pk}))
+        if name == 'clients':
+            rows = rows.select_related('user')
+        rows = list(rows.order_by('updated_at', pk_field)[:limit])
+
+        changes, tombstones = [], []
+        for row in rows:
+            if row.is_active:
+                changes.append(row)
+            else:
+                tombstones.append({id_key: getattr(row, pk_field), 'updated_at': row.updated_at, 'deleted': True})
+        data[name] = serializer_class(changes, many=True).data + tombstones
+        if rows:
+            positions[name] = (rows[-1].updated_at, getattr(rows[-1], pk_field))
+        data['has_more'] = data['has_more'] or len(rows) == limit
+    data['cursor'] = encode_cursor(positions, issued_at)
+    return data
@@ -1,3 +1,1271 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from utils.authentication import snapshot_key
+from utils.cache import bump_client_versions
+from utils.sqlite import sqlite_pragmas
+from utils.serializers import ValuesSerializer
+from utils.metrics import metrics
+from utils.replica import replica_synced_at, sync_replica
+from utils.schema import generate_schema, schema_cache
+from utils.slow_queries import fingerprint, slow_query_log
+from utils.tokens import blacklist_filter
+from .models import (Client, Warehouse, RecordsModel, CustomUser, StockBalance, DeactivationJob, MovementRollup,
+                     ArchivedRecord, ArchivedWarehouse)
+from .serializers import LoginResponseSerializer, RecordsSerializer, WarehouseSerializer
+from .views import ClientViewSet, WarehouseViewSet, RecordsViewSet
+from .write_buffer import RecordWriteBuffer, record_buffer
 
-# Create your tests here.
+
+def create_client(username, warehouses=1, records=1):
+    user = CustomUser.objects.create_user(username=username, password='password')
+    client = Client.objects.create(user=user)
+    for index in range(warehouses):
+        warehouse = Warehouse.objects.create(name=f'{username}-{index}', address='address', client=client)
+        for _ in range(records):
+            RecordsModel.objects.create(warehouse=warehouse, type_record='IN', quantity=10)
+    return client
+
+
+@override_settings(METRICS_ENABLED=False)
+class APITestCase(TestCase):
+    """Starts every test with empty caches, they outlive the per-test database."""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        blacklist_filter.reset()
+        metrics.reset()
+
+
+class NestedSerializationQueryCountTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_client_list_query_count_is_constant(self):
+        create_client('first')
+        with self.assertNumQueries(3):
+            response = self.api.get('/api/clients/?expand=warehouses,records')
+        self.assertEqual(response.status_code, 200)
+
+        create_client('second', warehouses=5, records=4)
+        create_client('third', warehouses=3, records=2)
+        with self.assertNumQueries(3):
+            response = self.api.get('/api/clients/?expand=warehouses,records')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_client_list_with_stock_query_count_is_constant(self):
+        create_client('first', warehouses=2)
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/clients/?expand=warehouses,stock')
+        self.assertEqual(response.status_code, 200)
+
+        create_client('second', warehouses=3)
+        create_client('third', warehouses=3)
+        call_command('rebuild_stock', stdout=StringIO())
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/clients/?expand=warehouses,stock')
+        self.assertEqual(response.status_code, 200)
+        stocks = [warehouse['stock'] for client in response.data['results'] for warehouse in client['warehouses']]
+        self.assertEqual(len(stocks), 8)
+        self.assertTrue(all(stock['total_in'] == 10 for stock in stocks))
+
+    def test_warehouse_list_query_count_is_constant(self):
+        create_client('first', warehouses=2, records=2)
+        create_client('second', warehouses=4, records=3)
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/warehouses/?expand=records')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertTrue(all(len(warehouse['records']) in (2, 3) for warehouse in response.data['results']))
+
+    def test_inactive_rows_are_not_serialized(self):
+        client = create_client('first', warehouses=2, records=2)
+        warehouse = client.warehouses.first()
+        warehouse.is_active = False
+        warehouse.save()
+        response = self.api.get('/api/clients/?expand=warehouses,records')
+        self.assertEqual(len(response.data['results'][0]['warehouses']), 1)
+        self.assertEqual(len(response.data['results'][0]['warehouses'][0]['records']), 2)
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    @override_settings(API_PAGE_SIZE=4)
+    def test_records_are_paged_without_count(self):
+        create_client('first', warehouses=2, records=5)
+        seen = []
+        url = '/api/records/'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            self.assertLessEqual(len(response.data['results']), 4)
+            seen.extend(record['id_record'] for record in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+
+    @override_settings(API_PAGE_SIZE=3)
+    def test_rows_with_the_same_created_at_are_paged_by_pk(self):
+        create_client('first', warehouses=1, records=10)
+        RecordsModel.objects.update(created_at=timezone.now())
+        seen, pages = [], []
+        url = '/api/records/'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.get(url)
+            self.assertNotIn('OFFSET', queries[0]['sql'].split('LIMIT')[-1])
+            pages.append(response.data)
+            seen.extend(record['id_record'] for record in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted(seen, key=str))
+        self.assertEqual(len(set(seen)), 10)
+
+        previous = self.api.get(pages[-1]['previous'])
+        self.assertEqual(previous.data['results'], pages[-2]['results'])
+
+    def test_page_size_query_param_is_capped(self):
+        create_client('first', warehouses=1, records=3)
+        with override_settings(API_MAX_PAGE_SIZE=2):
+            response = self.api.get('/api/records/?page_size=50')
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class StockBalanceTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.warehouse = create_client('first', warehouses=1, records=0).warehouses.get()
+
+    def post_record(self, type_record, quantity):
+        response = self.api.post('/api/records/', {
+            'id_warehouse': str(self.warehouse.id), 'type_record': type_record, 'quantity': quantity,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id_record']
+
+    def test_balance_follows_created_and_deleted_records(self):
+        self.post_record('IN', 100)
+        self.post_record('IN', 20)
+        id_record = self.post_record('OUT', 30)
+        response = self.api.get(f'/api/warehouses/{self.warehouse.id}/stock/')
+        self.assertEqual((response.data['total_in'], response.data['total_out'], response.data['net']), (120, 30, 90))
+
+        self.api.delete(f'/api/records/{id_record}/')
+        response = self.api.get(f'/api/warehouses/{self.warehouse.id}/')
+        self.assertNotIn('stock', response.data)
+        response = self.api.get(f'/api/warehouses/{self.warehouse.id}/?expand=stock')
+        self.assertEqual(response.data['stock']['net'], 120)
+        response = self.api.get(f'/api/warehouses/{self.warehouse.id}/?include_stock=true')
+        self.assertEqual(response.data['stock']['net'], 120)
+
+    def test_rebuild_command_repairs_drift(self):
+        self.post_record('IN', 50)
+        call_command('rebuild_stock', '--check', stdout=StringIO())
+        StockBalance.objects.update(total_in=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_stock', '--check', stdout=StringIO())
+        call_command('rebuild_stock', stdout=StringIO())
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_in, 50)
+        call_command('rebuild_stock', '--check', stdout=StringIO())
+
+
+class MovementReportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.warehouse = create_client('first', warehouses=1, records=0).warehouses.get()
+
+    def report(self, **params):
+        params.setdefault('start', '2000-01-01T00:00:00Z')
+        params.setdefault('end', '2100-01-01T00:00:00Z')
+        response = self.api.get('/api/reports/movements/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rollups_follow_the_records_endpoint(self):
+        for type_record, quantity in [('IN', 10), ('IN', 5), ('OUT', 3)]:
+            self.api.post('/api/records/', {'id_warehouse': str(self.warehouse.id), 'type_record': type_record,
+                                            'quantity': quantity}, format='json')
+        rows = {row['type_record']: row for row in self.report(granularity='hour')}
+        self.assertEqual((rows['IN']['total_quantity'], rows['IN']['record_count']), (15, 2))
+        self.assertEqual(rows['OUT']['total_quantity'], 3)
+
+        record = RecordsModel.objects.get(type_record='OUT')
+        self.api.delete(f'/api/records/{record.id_record}/')
+        rows = self.report(group_by='client')
+        self.assertEqual([row['type_record'] for row in rows], ['IN'])
+        self.assertEqual(str(rows[0]['id_client']), str(self.warehouse.client_id))
+
+    def test_backfill_matches_the_ledger(self):
+        for quantity in (1, 2, 3):
+            RecordsModel.objects.create(warehouse=self.warehouse, type_record='IN', quantity=quantity)
+        self.assertEqual(self.report(), [])
+        call_command('backfill_rollups', stdout=StringIO())
+        call_command('backfill_rollups', stdout=StringIO())
+        rows = self.report()
+        self.assertEqual((rows[0]['total_quantity'], rows[0]['record_count']), (6, 3))
+
+
+class RecordsBulkTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+        self.warehouse = create_client('first', warehouses=1, records=0).warehouses.get()
+
+    @override_settings(RECORDS_BULK_BATCH_SIZE=7)
+    def test_bulk_insert_uses_constant_queries(self):
+        items = [{'id_warehouse': str(self.warehouse.id), 'type_record': 'IN', 'quantity': 2} for _ in range(50)]
+        # warehouse lookup, savepoint pair, 8 insert batches, stock and rollup upserts
+        moment = timezone.now().replace(minute=30)
+        with self.assertNumQueries(15), mock.patch('django.utils.timezone.now', return_value=moment):
+            response = self.api.post('/api/records/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(RecordsModel.objects.filter(warehouse=self.warehouse).count(), 50)
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_in, 100)
+
+    def test_bulk_reports_per_item_errors(self):
+        inactive = create_client('second', warehouses=1, records=0).warehouses.get()
+        inactive.is_active = False
+        inactive.save()
+        items = [
+            {'id_warehouse': str(self.warehouse.id), 'type_record': 'OUT', 'quantity': 1},
+            {'id_warehouse': str(inactive.id), 'type_record': 'IN', 'quantity': 1},
+            {'id_warehouse': '3fa85f64-5717-4562-b3fc-2c963f66afa6', 'type_record': 'IN', 'quantity': 1},
+            {'id_warehouse': str(self.warehouse.id), 'type_record': 'SIDEWAYS', 'quantity': 1},
+        ]
+        response = self.api.post('/api/records/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data], ['created', 'error', 'error', 'error'])
+        self.assertTrue(RecordsModel.objects.filter(id_record=response.data[0]['id_record']).exists())
+
+
+class RecordsExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('first', warehouses=2, records=3)
+        create_client('second', warehouses=1, records=4)
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user.user)
+
+    def test_csv_export_is_scoped_to_the_client(self):
+        response = self.api.get('/api/records/export/?format=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id_record,id_warehouse,type_record,quantity,created_at,updated_at,is_active')
+        self.assertEqual(len(lines), 7)
+
+    def test_ndjson_export_matches_the_serializer(self):
+        warehouse = self.client_user.warehouses.first()
+        response = self.api.get(f'/api/records/export/?format=ndjson&id_warehouse={warehouse.id}')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        records = RecordsModel.objects.filter(warehouse=warehouse).order_by('created_at', 'id_record')
+        self.assertEqual(rows, json.loads(JSONRenderer().render(RecordsSerializer(records, many=True).data)))
+
+
+class ImportLedgerTests(APITestCase):
+
+    def write_ledger(self, rows):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='')
+        self.addCleanup(os.unlink, handle.name)
+        writer = csv.writer(handle)
+        writer.writerow(['username', 'warehouse', 'address', 'type_record', 'quantity', 'created_at'])
+        writer.writerows(rows)
+        handle.close()
+        return handle.name
+
+    def test_import_resolves_names_and_keeps_history(self):
+        create_client('first', warehouses=0)
+        path = self.write_ledger([
+            ['first', 'north', 'addr', 'IN', 10, '2024-01-01T10:15:00+00:00'],
+            ['first', 'north', 'addr', 'OUT', 4, '2024-01-02T10:15:00+00:00'],
+            ['newcomer', 'south', 'addr', 'IN', 7, '2024-01-03T10:15:00+00:00'],
+        ])
+        call_command('import_ledger', path, '--chunk-size', '2', stdout=StringIO())
+        north = Warehouse.objects.get(name='north')
+        self.assertEqual(north.client.username, 'first')
+        self.assertEqual(StockBalance.objects.get(warehouse=north).net, 6)
+        self.assertEqual(RecordsModel.objects.get(warehouse=north, type_record='IN').created_at.year, 2024)
+        self.assertTrue(Client.objects.filter(user__username='newcomer').exists())
+
+    def test_failed_import_resumes_after_last_chunk(self):
+        rows = [['first', 'north', 'addr', 'IN', 1, ''] for _ in range(5)]
+        rows[3][4] = 'many'
+        path = self.write_ledger(rows)
+        with self.assertRaises(CommandError):
+            call_command('import_ledger', path, '--chunk-size', '2', stdout=StringIO())
+        self.assertEqual(RecordsModel.objects.count(), 2)
+
+        rows[3][4] = 1
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['username', 'warehouse', 'address', 'type_record', 'quantity', 'created_at'])
+            writer.writerows(rows)
+        call_command('import_ledger', path, '--chunk-size', '2', stdout=StringIO())
+        self.assertEqual(RecordsModel.objects.count(), 5)
+
+
+class QueryPlanTests(APITestCase):
+    """Fails when a hot query shape falls back to a full table scan."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=2, records=2)
+
+    def viewset_queryset(self, viewset_class, user):
+        view = viewset_class(action_map={'get': 'list'}, format_kwarg=None)
+        view.request = view.initialize_request(APIRequestFactory().get('/'))
+        view.request.user = user
+        ordering = view.pagination_class.ordering
+        return view.get_queryset().order_by(*ordering)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset):
+        plan = self.query_plan(queryset)
+        full_scans = [step for step in plan if step.startswith('SCAN') and 'USING' not in step]
+        self.assertEqual(full_scans, [], plan)
+
+    def test_viewset_querysets_use_indexes(self):
+        for viewset_class in (ClientViewSet, WarehouseViewSet, RecordsViewSet):
+            for user in (self.admin, self.client_user.user):
+                with self.subTest(viewset=viewset_class.__name__, staff=user.is_staff):
+                    self.assertNoFullScan(self.viewset_queryset(viewset_class, user))
+
+    def test_cursor_positions_seek_on_the_ordering_index(self):
+        for viewset_class in (ClientViewSet, WarehouseViewSet, RecordsViewSet):
+            paginator = viewset_class.pagination_class()
+            position = json.dumps([str(timezone.now()), str(self.client_user.pk)])
+            for reverse in (False, True):
+                with self.subTest(viewset=viewset_class.__name__, reverse=reverse):
+                    queryset = self.viewset_queryset(viewset_class, self.admin).filter(
+                        paginator.position_filter(position, reverse))
+                    plan = self.query_plan(queryset)
+                    self.assertTrue(any(step.startswith('SEARCH') and 'created_at' in step for step in plan), plan)
+
+    def test_prefetch_querysets_use_indexes(self):
+        warehouse_ids = list(self.client_user.warehouses.values_list('id', flat=True))
+        self.assertNoFullScan(RecordsModel.objects.filter(is_active=True, warehouse_id__in=warehouse_ids))
+        self.assertNoFullScan(Warehouse.objects.filter(is_active=True, client_id__in=[self.client_user.pk]))
+
+
+class SQLiteTuningTests(APITestCase):
+
+    def test_profile_is_applied_to_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_TUNING['BUSY_TIMEOUT'])
+
+    def test_disabled_profile_emits_nothing(self):
+        self.assertEqual(sqlite_pragmas({'ENABLED': False, 'JOURNAL_MODE': 'WAL'}), [])
+        self.assertEqual(sqlite_pragmas({'SYNCHRONOUS': 'FULL'}), ['PRAGMA synchronous = FULL'])
+
+
+@override_settings(API_RESPONSE_CACHE_ENABLED=False)
+class CachedAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('first', warehouses=1, records=1)
+        self.api = APIClient()
+        token = RefreshToken.for_user(self.client_user.user).access_token
+        self.api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_reads_cost_no_auth_query_once_cached(self):
+        with self.assertNumQueries(2):
+            self.api.get('/api/warehouses/')
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/warehouses/')
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_saves_invalidate_the_snapshot(self):
+        self.api.get('/api/warehouses/')
+        user = self.client_user.user
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.api.get('/api/warehouses/').status_code, 401)
+
+        user.is_active = True
+        user.save()
+        self.assertEqual(self.api.get('/api/warehouses/').status_code, 200)
+        self.client_user.is_active = False
+        self.client_user.save()
+        self.api.get('/api/warehouses/')
+        snapshot = caches[settings.AUTH_USER_CACHE].get(snapshot_key(user.pk))
+        self.assertFalse(snapshot['client_is_active'])
+
+    def test_logout_invalidates_the_snapshot(self):
+        self.api.get('/api/warehouses/')
+        refresh = RefreshToken.for_user(self.client_user.user)
+        response = self.api.post('/api/logout/', {'refresh': str(refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(caches[settings.AUTH_USER_CACHE].get(snapshot_key(self.client_user.user.pk)))
+
+
+class LoginTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('first', warehouses=0)
+        self.api = APIClient()
+
+    def login(self, username='first', password='password'):
+        return self.api.post('/api/login/', {'username': username, 'password': password}, format='json')
+
+    def test_login_uses_one_lookup_and_mints_tokens(self):
+        # user and client in one query, then the outstanding refresh token insert
+        with self.assertNumQueries(2):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'first')
+        self.assertEqual(set(response.data), set(LoginResponseSerializer().fields))
+        self.assertEqual(response.data['user_id'], str(self.client_user.user_id))
+        token = RefreshToken(response.data['refresh'])
+        self.assertEqual(str(token['user_id']), str(self.client_user.user_id))
+
+    def test_login_rejections(self):
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertEqual(self.login(username='nobody').status_code, 401)
+        self.client_user.is_active = False
+        self.client_user.save()
+        self.assertEqual(self.login().status_code, 403)
+
+
+@override_settings(JWT_BLACKLIST_FILTER_SYNC_INTERVAL=3600)
+class BlacklistFilterTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_client('first', warehouses=0).user
+        self.api = APIClient()
+
+    def refresh(self, token):
+        return self.api.post('/api/token/refresh/', {'refresh': str(token)}, format='json')
+
+    def test_rotated_token_is_rejected_without_blacklist_query(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+        fresh = RefreshToken.for_user(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.refresh(fresh).status_code, 200)
+        self.assertFalse(any(query['sql'].startswith('SELECT 1 AS "a" FROM "token_blacklist_blacklistedtoken"')
+                             for query in queries))
+
+    def test_filter_picks_up_other_processes_after_sync(self):
+        token = RefreshToken.for_user(self.user)
+        blacklist_filter.sync()
+        with mock.patch('app.signals.blacklist_filter'):
+            token.blacklist()
+        self.assertFalse(blacklist_filter.might_contain(token['jti']))
+        blacklist_filter.sync()
+        self.assertTrue(blacklist_filter.might_contain(token['jti']))
+
+    def test_prune_deletes_expired_tokens(self):
+        expired = RefreshToken.for_user(self.user)
+        expired.blacklist()
+        OutstandingToken.objects.filter(jti=expired['jti']).update(expires_at=timezone.now() - timedelta(days=1))
+        RefreshToken.for_user(self.user)
+        call_command('prune_tokens', '--batch-size', '1', stdout=StringIO())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertEqual(BlacklistedToken.objects.count(), 0)
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=1, records=2)
+        self.other = create_client('second', warehouses=1, records=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user.user)
+
+    def test_unchanged_poll_is_served_from_cache_and_revalidated(self):
+        response = self.api.get('/api/records/')
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            cached = self.api.get('/api/records/')
+        self.assertEqual(cached.data, response.data)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.api.get('/api/records/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_scopes_are_isolated_and_bumped_by_writes(self):
+        warehouse = self.client_user.warehouses.get()
+        self.assertEqual(len(self.api.get('/api/records/').data['results']), 2)
+        self.api.force_authenticate(self.admin)
+        self.assertEqual(len(self.api.get('/api/records/').data['results']), 3)
+
+        RecordsModel.objects.create(warehouse=warehouse, type_record='OUT', quantity=1)
+        self.assertEqual(len(self.api.get('/api/records/').data['results']), 4)
+        self.api.force_authenticate(self.client_user.user)
+        self.assertEqual(len(self.api.get('/api/records/').data['results']), 3)
+
+        etag = self.api.get(f'/api/warehouses/{warehouse.id}/')['ETag']
+        self.client_user.is_active = False
+        self.client_user.save()
+        response = self.api.get(f'/api/warehouses/{warehouse.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_reads_before_the_commit_of_a_write_are_not_kept(self):
+        warehouse = self.client_user.warehouses.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            # The write's signal runs first; its rows are only visible to other readers at commit
+            bump_client_versions(self.client_user.pk)
+            self.assertEqual(self.api.get(f'/api/warehouses/{warehouse.id}/').data['name'], warehouse.name)
+            Warehouse.objects.filter(pk=warehouse.pk).update(name='renamed')
+        self.assertEqual(self.api.get(f'/api/warehouses/{warehouse.id}/').data['name'], 'renamed')
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0, SQLITE_TUNING={**settings.SQLITE_TUNING, 'BUSY_TIMEOUT': 0})
+class SyncFeedTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('first', warehouses=2, records=2)
+        create_client('second', warehouses=1, records=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user.user)
+
+    def sync(self, since='', limit=None):
+        params = {'since': since}
+        if limit:
+            params['limit'] = limit
+        response = self.api.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_initial_sync_is_scoped_and_paged(self):
+        data = self.sync(limit=3)
+        self.assertTrue(data['has_more'])
+        self.assertEqual((len(data['clients']), len(data['warehouses']), len(data['records'])), (1, 2, 3))
+        data = self.sync(data['cursor'], limit=3)
+        self.assertEqual((len(data['clients']), len(data['warehouses']), len(data['records'])), (0, 0, 1))
+        self.assertFalse(self.sync(data['cursor'])['has_more'])
+
+    def test_cascade_deactivation_emits_tombstones(self):
+        cursor = self.sync()['cursor']
+        self.assertEqual(self.sync(cursor)['records'], [])
+        warehouse = self.client_user.warehouses.first()
+        warehouse.is_active = False
+        warehouse.save()
+        call_command('process_deactivations', stdout=StringIO())
+        data = self.sync(cursor)
+        self.assertEqual(len(data['warehouses']), 1)
+        self.assertTrue(data['warehouses'][0]['deleted'])
+        self.assertEqual(len(data['records']), 2)
+        self.assertTrue(all(record['deleted'] for record in data['records']))
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.api.get('/api/sync/', {'since': 'nope'}).status_code, 400)
+
+    def test_writes_waiting_on_the_lock_are_not_skipped(self):
+        fast, slow = self.client_user.warehouses.first().records.all()[:2]
+        RecordsModel.objects.update(updated_at=timezone.now() - timedelta(seconds=60))
+        RecordsModel.objects.filter(pk=fast.pk).update(quantity=11, updated_at=timezone.now() - timedelta(seconds=1))
+        with override_settings(SQLITE_TUNING={**settings.SQLITE_TUNING, 'BUSY_TIMEOUT': 5000}):
+            cursor = self.sync()['cursor']
+        # Stamped 4s ago, then waited on the write lock behind the fast write
+        RecordsModel.objects.filter(pk=slow.pk).update(quantity=12, updated_at=timezone.now() - timedelta(seconds=4))
+        records = self.sync(cursor)['records']
+        self.assertEqual({record['quantity'] for record in records}, {11, 12})
+
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        create_client('first', warehouses=3, records=4)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_listings_are_compact_by_default(self):
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/clients/')
+        self.assertNotIn('warehouses', response.data['results'][0])
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/warehouses/')
+        self.assertNotIn('records', response.data['results'][0])
+        self.assertIn('username', response.data['results'][0])
+
+    def test_fields_skip_unrequested_relations(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/warehouses/?fields=id_warehouse,name')
+        self.assertEqual(set(response.data['results'][0]), {'id_warehouse', 'name'})
+        # app_client is joined for its active flag only, the user row is not loaded
+        self.assertNotIn('app_customuser', queries[0]['sql'])
+
+    def test_expand_nests_warehouses_without_records(self):
+        with self.assertNumQueries(2):
+            response = self.api.get('/api/clients/?expand=warehouses')
+        warehouses = response.data['results'][0]['warehouses']
+        self.assertEqual(len(warehouses), 3)
+        self.assertNotIn('records', warehouses[0])
+
+
+@override_settings(ROOT_URLCONF='project.asgi_urls')
+class AsyncReadPathTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=2, records=3)
+        create_client('second', warehouses=1, records=1)
+        self.warehouse = self.client_user.warehouses.first()
+        self.tokens = {user.username: str(RefreshToken.for_user(user).access_token)
+                       for user in (self.admin, self.client_user.user)}
+
+    def sync_get(self, path, username, **headers):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens[username]}')
+        with override_settings(ROOT_URLCONF='project.urls'):
+            return api.get(path, **headers)
+
+    async def async_get(self, path, username=None, **headers):
+        if username:
+            headers['AUTHORIZATION'] = f'Bearer {self.tokens[username]}'
+        return await self.async_client.get(path, headers=headers)
+
+    async def test_responses_match_the_sync_views(self):
+        paths = [
+            '/api/warehouses/', '/api/warehouses/?expand=records,stock', '/api/warehouses/?fields=name&page_size=1',
+            f'/api/warehouses/{self.warehouse.id}/', f'/api/warehouses/{self.warehouse.id}/stock/',
+            '/api/records/', '/api/records/?page_size=2&fields=quantity',
+        ]
+        for username in ('admin', 'first'):
+            for path in paths:
+                with override_settings(API_RESPONSE_CACHE_ENABLED=False), \
+                        mock.patch.object(WarehouseViewSet, 'initial', side_effect=AssertionError), \
+                        mock.patch.object(RecordsViewSet, 'initial', side_effect=AssertionError):
+                    response = await self.async_get(path, username)
+                expected = await sync_to_async(self.sync_get)(path, username)
+                self.assertEqual(response.status_code, 200, path)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+
+    async def test_shares_the_response_cache(self):
+        path = f'/api/warehouses/{self.warehouse.id}/'
+        etag = (await sync_to_async(self.sync_get)(path, 'first'))['ETag']
+        response = await self.async_get(path, 'first', IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_errors_and_writes_fall_back_to_the_sync_views(self):
+        self.assertEqual((await self.async_get('/api/warehouses/')).status_code, 401)
+        other = await Warehouse.objects.exclude(client=self.client_user).afirst()
+        self.assertEqual((await self.async_get(f'/api/warehouses/{other.id}/', 'first')).status_code, 404)
+        self.assertEqual((await self.async_get('/api/warehouses/?format=json', 'first')).status_code, 200)
+        response = await self.async_client.post(
+            '/api/warehouses/', {'name': 'new', 'address': 'address', 'id_client': str(self.client_user.pk)},
+            content_type='application/json', headers={'AUTHORIZATION': f'Bearer {self.tokens["admin"]}'})
+        self.assertEqual(response.status_code, 201)
+
+
+class DeactivationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=2, records=3)
+        create_client('second', warehouses=1, records=1)
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_destroy_hides_the_client_at_once_and_the_worker_flips_rows_in_batches(self):
+        response = self.api.delete(f'/api/clients/{self.client_user.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(RecordsModel.objects.filter(warehouse__client=self.client_user, is_active=True).count(), 6)
+        self.assertEqual(len(self.api.get('/api/warehouses/').data['results']), 1)
+        self.assertEqual(len(self.api.get('/api/records/').data['results']), 1)
+
+        job = self.api.get('/api/deactivations/', {'id_client': str(self.client_user.pk)}).data['results'][0]
+        self.assertEqual(job['status'], 'pending')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('process_deactivations', '--batch-size', '2', stdout=StringIO())
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "app_recordsmodel"')]
+        self.assertEqual(len(updates), 4)
+
+        job = self.api.get(f"/api/deactivations/{job['id']}/").data
+        self.assertEqual((job['status'], job['records_total'], job['records_done'], job['warehouses_done']),
+                         ('done', 6, 6, 2))
+        self.assertFalse(RecordsModel.objects.filter(warehouse__client=self.client_user, is_active=True).exists())
+        self.assertFalse(Warehouse.objects.filter(client=self.client_user, is_active=True).exists())
+
+    def test_reactivated_target_cancels_the_job(self):
+        warehouse = self.client_user.warehouses.first()
+        self.assertEqual(self.api.delete(f'/api/warehouses/{warehouse.id}/').status_code, 204)
+        warehouse.refresh_from_db()
+        warehouse.is_active = True
+        warehouse.save()
+        call_command('process_deactivations', stdout=StringIO())
+        self.assertEqual(DeactivationJob.objects.get(warehouse=warehouse).status, DeactivationJob.CANCELLED)
+        self.assertEqual(RecordsModel.objects.filter(warehouse=warehouse, is_active=True).count(), 3)
+
+    def test_progress_is_staff_only(self):
+        self.api.force_authenticate(self.client_user.user)
+        self.assertEqual(self.api.get('/api/deactivations/').status_code, 403)
+
+    def test_invalid_filters_are_rejected(self):
+        self.assertEqual(self.api.delete(f'/api/clients/{self.client_user.pk}/').status_code, 204)
+        for params in ({'id_client': 'nope'}, {'id_warehouse': 'nope'}):
+            response = self.api.get('/api/deactivations/', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(next(iter(params)), response.data['errors'])
+        response = self.api.get('/api/deactivations/', {'id_warehouse': str(self.client_user.pk)})
+        self.assertEqual(response.data['results'], [])
+
+
+class ValuesSerializerTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_client('first', warehouses=2, records=3)
+        create_client('second', warehouses=1, records=2)
+
+    def test_output_is_byte_identical_to_the_serializers(self):
+        cases = [
+            (RecordsSerializer, RecordsModel.objects.all(), None),
+            (RecordsSerializer, RecordsModel.objects.all(), {'id_warehouse', 'quantity', 'created_at'}),
+            (WarehouseSerializer, Warehouse.objects.select_related('client__user'), None),
+            (WarehouseSerializer, Warehouse.objects.select_related('client__user'), {'id_client', 'name'}),
+        ]
+        renderer = JSONRenderer()
+        for serializer_class, queryset, fields in cases:
+            with self.subTest(serializer=serializer_class.__name__, fields=fields):
+                queryset = queryset.order_by('created_at', 'pk')
+                values_serializer = ValuesSerializer.for_serializer(serializer_class(context={'fields': fields}))
+                rows = queryset.values(*values_serializer.columns)
+                expected = serializer_class(queryset, many=True, context={'fields': fields}).data
+                self.assertEqual(renderer.render(values_serializer.to_representation(rows)), renderer.render(expected))
+
+    def test_expanded_relations_use_the_serializer(self):
+        self.assertIsNone(ValuesSerializer.for_serializer(WarehouseSerializer(context={'expand': {'records'}})))
+        self.assertIsNotNone(ValuesSerializer.for_serializer(WarehouseSerializer(context={})))
+
+
+class SeedAndBenchmarkTests(APITestCase):
+
+    def test_seed_data_keeps_aggregates_consistent(self):
+        call_command('seed_data', '--clients', '3', '--warehouses-per-client', '2', '--records-per-warehouse', '5',
+                     '--seed', '1', stdout=StringIO())
+        self.assertEqual((Client.objects.count(), Warehouse.objects.count(), RecordsModel.objects.count()), (3, 6, 30))
+        call_command('rebuild_stock', '--check', stdout=StringIO())
+        self.assertEqual(sum(MovementRollup.objects.values_list('record_count', flat=True)), 30)
+
+    def test_bench_api_reports_every_endpoint_and_compares_to_a_baseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command('bench_api', '--sizes', '2x1x3', '--repeat', '2', '--output', path, stderr=StringIO())
+            with open(path) as handle:
+                report = json.load(handle)
+            endpoints = report['sizes']['2x1x3']['endpoints']
+            self.assertEqual({name: result['errors'] for name, result in endpoints.items() if result['errors']}, {})
+            self.assertIn('GET /api/records/ [client]', endpoints)
+
+            endpoints['GET /api/records/ [client]']['queries_max'] -= 1
+            with open(path, 'w') as handle:
+                json.dump(report, handle)
+            with self.assertRaisesMessage(CommandError, 'GET /api/records/ [client]'):
+                call_command('bench_api', '--sizes', '2x1x3', '--repeat', '2', '--baseline', path,
+                             '--tolerance', '100', stdout=StringIO(), stderr=StringIO())
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_ENABLED=True, METRICS_DIR=directory.name,
+                                              METRICS_FLUSH_INTERVAL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=1, records=3)
+
+    def api(self, user):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return api
+
+    def get(self, path, user):
+        return self.api(user).get(path)
+
+    @override_settings(API_RESPONSE_CACHE_ENABLED=False)
+    def test_records_latency_queries_and_size_per_view(self):
+        api, queries = self.api(self.client_user.user), 0
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as captured:
+                response = api.get('/api/records/')
+            queries += len(captured)
+        self.get('/api/records/missing/', self.client_user.user)
+
+        body = self.get('/api/metrics', self.admin).content.decode()
+        self.assertIn('api_requests_total{view="RecordsViewSet.list",status="200"} 3', body)
+        self.assertIn('api_requests_total{view="RecordsViewSet.retrieve",status="404"} 1', body)
+        self.assertIn('api_request_duration_seconds_count{view="RecordsViewSet.list"} 3', body)
+        self.assertIn(f'api_response_size_bytes_sum{{view="RecordsViewSet.list"}} {3 * len(response.content)}', body)
+        series = metrics.collect()['RecordsViewSet.list']
+        self.assertEqual(series['api_request_queries']['sum'], queries)
+        self.assertGreater(series['query_seconds'], 0)
+
+    def test_staff_only(self):
+        self.assertEqual(self.get('/api/metrics', self.client_user.user).status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics').status_code, 401)
+        self.assertEqual(self.get('/api/metrics', self.admin)['Content-Type'], 'text/plain; charset=utf-8')
+
+    def test_sums_the_files_of_other_processes(self):
+        self.get('/api/records/', self.client_user.user)
+        metrics.flush()
+        with open(metrics.path()) as handle:
+            other_process = handle.read()
+        with open(metrics.path(pid=os.getpid() + 1), 'w') as handle:
+            handle.write(other_process)
+        with open(metrics.path(pid=os.getpid() + 2), 'w') as handle:
+            handle.write('{"truncated')
+
+        body = self.get('/api/metrics', self.admin).content.decode()
+        self.assertIn('api_requests_total{view="RecordsViewSet.list",status="200"} 2', body)
+
+    @override_settings(ROOT_URLCONF='project.asgi_urls')
+    async def test_async_views_share_the_series_of_their_viewset(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.client_user.user).access_token))()
+        response = await self.async_client.get('/api/records/', headers={'AUTHORIZATION': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        series = metrics.collect()['RecordsViewSet.list']
+        self.assertEqual(series['status'], {'200': 1})
+        self.assertGreater(series['api_request_queries']['sum'], 0)
+
+    @override_settings(ROOT_URLCONF='project.asgi_urls', API_RESPONSE_CACHE_ENABLED=False)
+    async def test_concurrent_async_requests_count_their_own_queries(self):
+        other = await sync_to_async(create_client)('second', warehouses=2, records=4)
+        tokens = await sync_to_async(lambda: [str(RefreshToken.for_user(client.user).access_token)
+                                              for client in (self.client_user, other)])()
+
+        def get(token):
+            return self.async_client.get('/api/records/', headers={'AUTHORIZATION': f'Bearer {token}'})
+
+        alone = []
+        for token in tokens * 2:
+            metrics.reset()
+            await get(token)
+            alone.append(metrics.collect()['RecordsViewSet.list']['api_request_queries']['sum'])
+        metrics.reset()
+        responses = await asyncio.gather(*(get(token) for token in tokens))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        series = metrics.collect()['RecordsViewSet.list']
+        self.assertEqual(series['status'], {'200': 2})
+        self.assertEqual(series['api_request_queries']['sum'], sum(alone[2:]))
+
+
+class SlowQueryLogTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'logs', 'slow.jsonl')
+        settings_override = override_settings(SLOW_QUERY_LOG_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0,
+                                              SLOW_QUERY_LOG_FILE=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(slow_query_log.close)
+        self.client_user = create_client('first', warehouses=2, records=3)
+
+    def entries(self):
+        with open(self.path) as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_fingerprint_collapses_literals_and_in_lists(self):
+        first = fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s) AND "name" = \'a\' LIMIT 21')
+        second = fingerprint('SELECT  * FROM "t" WHERE "id" IN (%s) AND "name" = \'b\'\nLIMIT 3')
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'SELECT * FROM "t" WHERE "id" IN (?+) AND "name" = ? LIMIT ?')
+
+    def test_logs_the_view_and_plan_of_slow_queries(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.client_user.user).access_token}')
+        with override_settings(API_RESPONSE_CACHE_ENABLED=False):
+            self.assertEqual(api.get('/api/records/').status_code, 200)
+
+        listing = [entry for entry in self.entries()
+                   if entry['view'] == 'RecordsViewSet.list' and 'FROM "app_recordsmodel"' in entry['sql']]
+        self.assertTrue(listing)
+        self.assertTrue(any(step.startswith(('SEARCH', 'SCAN')) for step in listing[0]['plan']))
+        self.assertFalse(any('EXPLAIN' in entry['sql'] for entry in self.entries()))
+
+        out = StringIO()
+        call_command('slow_queries', '--order-by', 'count', stdout=out)
+        self.assertIn(listing[0]['fingerprint'], out.getvalue())
+        self.assertIn('RecordsViewSet.list x', out.getvalue())
+
+    def test_report_groups_the_rotated_files(self):
+        with override_settings(SLOW_QUERY_LOG_MAX_BYTES=2048, SLOW_QUERY_LOG_BACKUP_COUNT=50):
+            for _ in range(10):
+                list(RecordsModel.objects.filter(quantity=10))
+            out = StringIO()
+            call_command('slow_queries', '--json', stdout=out)
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        groups = json.loads(out.getvalue())
+        fingerprint_of_filter = fingerprint(str(RecordsModel.objects.filter(quantity=10).query))[0]
+        self.assertEqual([group['count'] for group in groups if group['fingerprint'] == fingerprint_of_filter], [10])
+
+
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client_user = create_client('first', warehouses=2, records=3)
+        self.closed, self.open = self.client_user.warehouses.order_by('created_at')
+        self.closed.is_active = False
+        self.closed.save()
+        call_command('process_deactivations', stdout=StringIO())
+        self.deleted_record = self.open.records.first()
+        self.deleted_record.is_active = False
+        self.deleted_record.save()
+        call_command('rebuild_stock', stdout=StringIO())
+        self.long_ago = timezone.now() - timedelta(days=40)
+
+    def age(self, queryset, moment=None):
+        queryset.update(updated_at=moment or self.long_ago)
+
+    def test_moves_old_inactive_rows_and_restores_them(self):
+        self.age(RecordsModel.objects.filter(is_active=False))
+        self.age(Warehouse.objects.filter(is_active=False))
+        created_at = {record.pk: record.created_at for record in RecordsModel.objects.all()}
+        call_command('archive_inactive', '--older-than', '30', '--batch-size', '2', stdout=StringIO())
+
+        self.assertEqual(ArchivedRecord.objects.count(), 4)
+        self.assertEqual(list(ArchivedWarehouse.objects.values_list('id', flat=True)), [self.closed.id])
+        self.assertFalse(RecordsModel.objects.filter(is_active=False).exists())
+        self.assertFalse(Warehouse.objects.filter(pk=self.closed.pk).exists())
+        self.assertFalse(StockBalance.objects.filter(warehouse_id=self.closed.pk).exists())
+        self.assertTrue(Client.objects.filter(pk=self.client_user.pk).exists())
+        self.assertEqual(ArchivedRecord.objects.get(pk=self.deleted_record.pk).client_id, self.client_user.pk)
+
+        call_command('restore_archived', '--warehouse', str(self.closed.pk), stdout=StringIO())
+        restored = Warehouse.objects.get(pk=self.closed.pk)
+        self.assertFalse(restored.is_active)
+        self.assertEqual(restored.records.count(), 3)
+        self.assertTrue(all(record.created_at == created_at[record.pk] for record in restored.records.all()))
+        call_command('restore_archived', '--record', str(self.deleted_record.pk), stdout=StringIO())
+        self.assertFalse(ArchivedRecord.objects.exists())
+        self.assertEqual(RecordsModel.objects.count(), 6)
+        call_command('rebuild_stock', '--check', stdout=StringIO())
+
+    def test_recent_rows_and_open_deactivations_stay(self):
+        self.age(Warehouse.objects.filter(pk=self.closed.pk))
+        other = self.client_user.warehouses.create(name='other', address='address')
+        RecordsModel.objects.create(warehouse=other, type_record='IN', quantity=1)
+        other.is_active = False
+        other.save()
+        self.age(Warehouse.objects.filter(pk=other.pk))
+        self.age(RecordsModel.objects.filter(is_active=False, warehouse=self.closed))
+
+        call_command('archive_inactive', '--older-than', '30', stdout=StringIO())
+        self.assertEqual(set(ArchivedWarehouse.objects.values_list('id', flat=True)), {self.closed.id})
+        self.assertTrue(RecordsModel.objects.filter(pk=self.deleted_record.pk).exists())
+        self.assertTrue(Warehouse.objects.filter(pk=other.pk).exists())
+
+    def test_sync_cursor_behind_archived_rows_is_rejected(self):
+        api = APIClient()
+        api.force_authenticate(self.client_user.user)
+        for model in (Client, Warehouse, RecordsModel):
+            self.age(model.objects.all(), timezone.now() - timedelta(days=60))
+        cursor = api.get('/api/sync/').data['cursor']
+        self.age(RecordsModel.objects.filter(pk=self.deleted_record.pk))
+        call_command('archive_inactive', '--older-than', '30', stdout=StringIO())
+
+        response = api.get('/api/sync/', {'since': cursor})
+        self.assertEqual(response.status_code, 400)
+        cursor = api.get('/api/sync/').data['cursor']
+        self.assertEqual(api.get('/api/sync/', {'since': cursor}).status_code, 200)
+
+
+@override_settings(RECORDS_WRITE_BUFFER_ENABLED=True, RECORDS_WRITE_BUFFER_WAIT_TIMEOUT=0)
+class WriteBufferTests(APITestCase):
+    """The flusher thread is not started, the tests flush the buffer themselves."""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(RECORDS_WRITE_BUFFER_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(RecordWriteBuffer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(record_buffer.flush)
+
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=1, records=1)
+        self.warehouse = self.client_user.warehouses.get()
+        call_command('rebuild_stock', stdout=StringIO())
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def create(self, quantity=5):
+        response = self.api.post('/api/records/', {
+            'id_warehouse': str(self.warehouse.id), 'type_record': 'IN', 'quantity': quantity}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_created_records_are_committed_together_and_read_with_their_token(self):
+        tokens = [self.create(quantity)['X-Commit-Token'] for quantity in (5, 7)]
+        self.assertEqual(self.api.post('/api/records/', {}, format='json').status_code, 400)
+        self.assertFalse(RecordsModel.objects.filter(pk__in=tokens).exists())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+        client_api = APIClient()
+        client_api.force_authenticate(self.client_user.user)
+        self.assertEqual(len(client_api.get('/api/records/').data['results']), 1)
+        response = client_api.get('/api/records/', HTTP_X_COMMIT_TOKEN=','.join(tokens))
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_in, 22)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_reads_with_unknown_or_invalid_tokens(self):
+        self.assertEqual(self.api.get('/api/records/', HTTP_X_COMMIT_TOKEN=str(self.warehouse.id)).status_code, 503)
+        self.assertEqual(self.api.get('/api/records/', HTTP_X_COMMIT_TOKEN='nope').status_code, 400)
+
+    def test_other_inserts_during_a_flush_keep_their_timestamps(self):
+        token = self.create()['X-Commit-Token']
+        flushed_at = timezone.now()
+        bulk_create, responses = RecordsModel.objects.bulk_create, []
+
+        def insert_during_flush(records, **kwargs):
+            if not responses:
+                responses.append(None)
+                responses[0] = self.api.post('/api/records/bulk/', [
+                    {'id_warehouse': str(self.warehouse.id), 'type_record': 'IN', 'quantity': 1}], format='json')
+            return bulk_create(records, **kwargs)
+
+        with mock.patch.object(RecordsModel.objects, 'bulk_create', side_effect=insert_during_flush):
+            record_buffer.flush()
+        self.assertEqual(responses[0].status_code, 201)
+        self.assertLess(RecordsModel.objects.get(pk=token).created_at, flushed_at)
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_in, 16)
+
+    @override_settings(ROOT_URLCONF='project.asgi_urls')
+    async def test_async_reads_wait_for_their_token(self):
+        token = (await sync_to_async(self.create)())['X-Commit-Token']
+        refresh = await sync_to_async(RefreshToken.for_user)(self.client_user.user)
+        headers = {'AUTHORIZATION': f'Bearer {refresh.access_token}', 'X-COMMIT-TOKEN': token}
+        response = await self.async_client.get('/api/records/', headers=headers)
+        self.assertEqual(len(json.loads(response.content)['results']), 2)
+        response = await self.async_client.get(f'/api/warehouses/{self.warehouse.id}/stock/', headers=headers)
+        self.assertEqual(json.loads(response.content)['total_in'], 15)
+
+    def test_tokens_of_dropped_or_foreign_records(self):
+        missing = {'id_record': str(RecordsModel().id_record), 'warehouse_id': str(RecordsModel().id_record),
+                   'type_record': 'IN', 'quantity': 1, 'created_at': '2024-01-02T03:04:05+00:00'}
+        with open(os.path.join(self.directory, '999999-crashed.log'), 'w', encoding='utf-8') as segment:
+            segment.write(json.dumps(missing) + '\n')
+        with mock.patch('app.write_buffer.process_alive', return_value=False), \
+                self.captureOnCommitCallbacks(execute=True):
+            record_buffer.replay_orphans()
+        response = self.api.get('/api/records/', HTTP_X_COMMIT_TOKEN=missing['id_record'])
+        self.assertEqual(response.status_code, 409)
+
+        token = self.create()['X-Commit-Token']
+        other = APIClient()
+        other.force_authenticate(create_client('second', warehouses=0).user)
+        self.assertEqual(other.get('/api/records/', HTTP_X_COMMIT_TOKEN=token).status_code, 503)
+        owner = APIClient()
+        owner.force_authenticate(self.client_user.user)
+        self.assertEqual(owner.get('/api/records/', HTTP_X_COMMIT_TOKEN=token).status_code, 200)
+
+    def test_records_of_a_since_deactivated_warehouse_are_stored_inactive(self):
+        token = self.create()['X-Commit-Token']
+        Warehouse.objects.filter(pk=self.warehouse.pk).update(is_active=False)
+        self.assertEqual(record_buffer.flush(), 1)
+        self.assertFalse(RecordsModel.objects.get(pk=token).is_active)
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_in, 10)
+
+    def test_segments_of_dead_processes_are_replayed_once(self):
+        records = [{'id_record': str(RecordsModel().id_record), 'warehouse_id': str(self.warehouse.id),
+                    'type_record': 'OUT', 'quantity': 3, 'created_at': '2024-01-02T03:04:05+00:00'}
+                   for _ in range(2)]
+        with open(os.path.join(self.directory, '999999-crashed.log'), 'w', encoding='utf-8') as segment:
+            segment.writelines(json.dumps(record) + '\n' for record in records + records[:1])
+            segment.write('{"id_record": "torn')
+
+        with mock.patch('app.write_buffer.process_alive', return_value=False):
+            call_command('replay_record_log', stdout=StringIO())
+        replayed = RecordsModel.objects.filter(type_record='OUT')
+        self.assertEqual(replayed.count(), 2)
+        self.assertEqual(replayed.first().created_at.year, 2024)
+        self.assertEqual(StockBalance.objects.get(warehouse=self.warehouse).total_out, 6)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+
+class SchemaCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(API_SCHEMA_CACHE_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        schema_cache.clear()
+        self.addCleanup(schema_cache.clear)
+        patcher = mock.patch('utils.schema.generate_schema', wraps=generate_schema)
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.api = APIClient()
+
+    def test_schema_is_generated_once_and_revalidated(self):
+        response = self.api.get('/api/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.API_SCHEMA_CACHE_MAX_AGE}')
+        self.assertEqual(self.api.get('/api/schema/')['ETag'], response['ETag'])
+        self.assertEqual(self.api.get('/api/schema/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        schema = json.loads(self.api.get('/api/schema/', HTTP_ACCEPT='application/json').content)
+        self.assertIn('jwtAuth', schema['components']['securitySchemes'])
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+        schema_cache.clear()
+        self.assertEqual(self.api.get('/api/schema/')['ETag'], response['ETag'])
+        self.assertEqual(self.generate.call_count, 1)
+
+    def test_cached_schema_matches_the_generated_one(self):
+        cached = self.api.get('/api/schema/', HTTP_ACCEPT='application/json')
+        with override_settings(API_SCHEMA_CACHE_ENABLED=False):
+            generated = self.api.get('/api/schema/', HTTP_ACCEPT='application/json')
+        self.assertEqual(cached['Content-Type'], generated['Content-Type'])
+        self.assertEqual(json.loads(cached.content), json.loads(generated.content))
+
+    def test_a_new_code_version_is_generated_again(self):
+        with override_settings(API_SCHEMA_VERSION='first'):
+            call_command('generate_schema', stdout=StringIO())
+            self.api.get('/api/schema/')
+        with override_settings(API_SCHEMA_VERSION='second'):
+            self.api.get('/api/schema/')
+            self.assertEqual(self.generate.call_count, 2)
+            call_command('generate_schema', stdout=StringIO())
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+@override_settings(METRICS_ENABLED=False, DATABASE_REPLICA_MAX_LAG=60, API_RESPONSE_CACHE_ENABLED=False)
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica alias mirrors the test database, the syncs write a real copy to a temporary file."""
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'replica.sqlite3')
+        settings_override = override_settings(DATABASE_REPLICA_NAME=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.admin = CustomUser.objects.create_user(username='admin', password='password', is_staff=True)
+        self.client_user = create_client('first', warehouses=1, records=2)
+        self.warehouse = self.client_user.warehouses.get()
+
+    def api(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api
+
+    def replica_queries(self, request):
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as default:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return len(replica), len(default)
+
+    def test_sync_copies_the_committed_database(self):
+        self.assertIsNone(replica_synced_at())
+        call_command('sync_replica', stdout=StringIO())
+        self.assertAlmostEqual(replica_synced_at(), timezone.now().timestamp(), delta=5)
+        copy = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute('SELECT COUNT(*) FROM app_recordsmodel').fetchone(), (2,))
+        self.assertEqual(copy.execute('PRAGMA journal_mode').fetchone(), ('delete',))
+
+    def test_reads_use_the_replica_until_the_scope_writes(self):
+        client_api = self.api(self.client_user.user)
+        self.assertEqual(self.replica_queries(lambda: client_api.get('/api/records/')), (0, 1))
+        sync_replica()
+        paths = ['/api/records/', '/api/warehouses/', f'/api/warehouses/{self.warehouse.id}/stock/',
+                 '/api/records/export/?format=csv', '/api/clients/']
+        for path in paths:
+            replica, default = self.replica_queries(lambda: client_api.get(path))
+            self.assertGreater(replica, 0, path)
+            self.assertEqual(default, 0, path)
+        self.assertEqual(self.replica_queries(lambda: client_api.get('/api/sync/'))[0], 0)
+
+        response = self.api(self.admin).post('/api/records/', {
+            'id_warehouse': str(self.warehouse.id), 'type_record': 'IN', 'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        replica, default = self.replica_queries(lambda: client_api.get('/api/records/'))
+        self.assertEqual(replica, 0)
+        self.assertEqual(len(client_api.get('/api/records/').data['results']), 3)
+        sync_replica()
+        self.assertEqual(self.replica_queries(lambda: client_api.get('/api/records/?page_size=1'))[1], 0)
+
+    def test_a_lagging_replica_is_not_used(self):
+        sync_replica()
+        with override_settings(DATABASE_REPLICA_MAX_LAG=0):
+            self.assertEqual(self.replica_queries(lambda: self.api(self.admin).get('/api/records/'))[0], 0)
@@ -1,13 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClientViewSet, WarehouseViewSet, RegisterUserView,RecordsViewSet
+from .views import (ClientViewSet, WarehouseViewSet, RegisterUserView,RecordsViewSet, MovementReportView, SyncView,
+DeactivationJobViewSet, MetricsView)
 
 router = DefaultRouter()
 router.register(r'clients', ClientViewSet)
 router.register(r'warehouses', WarehouseViewSet)
 router.register(r'records', RecordsViewSet)
+router.register(r'deactivations', DeactivationJobViewSet, basename='deactivation')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('client/register/', RegisterUserView.as_view({'post': 'create'}), name='register_clients'),
+    path('reports/movements/', MovementReportView.as_view(), name='movement_report'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,51 +1,90 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenBlacklistView
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework import viewsets, status,mixins
+from rest_framework.decorators import action
 from rest_framework.response import Response
-from utils.views import BaseView
-from .models import Client, Warehouse,RecordsModel
+from utils.views import BaseView, ReplicaReadMixin, SparseFieldsMixin, ValuesListMixin
+from utils.authentication import CachedJWTAuthentication, invalidate_user_snapshot
+from utils.tokens import FilteredRefreshToken
+from utils.cache import CachedReadMixin, bump_client_versions
+from utils.pagination import (ClientCursorPagination, WarehouseCursorPagination, RecordsCursorPagination,
+DeactivationJobCursorPagination)
+from utils.renderers import CSVRenderer, NDJSONRenderer, PrometheusRenderer
+from utils.metrics import metrics
+from .models import (Client, Warehouse,RecordsModel, StockBalance, MovementRollup, DeactivationJob,
+apply_record_aggregates, add_records_aggregates)
 from .serializers import ( ClientSerializer, WarehouseSerializer,LoginRequestSerializer,LoginResponseSerializer,
-RegisterRequestSerializer,RegisterResponseSerializer, RecordsSerializer)
+RegisterRequestSerializer,RegisterResponseSerializer, RecordsSerializer, StockBalanceSerializer,
+MovementReportRequestSerializer, MovementReportSerializer, RecordsBulkItemSerializer, RecordsBulkResultSerializer,
+RecordsExportRequestSerializer, SyncRequestSerializer, SyncResponseSerializer, DeactivationJobSerializer,
+DeactivationJobFilterSerializer)
+from .sync import InvalidCursor, changes_since
+from .exports import export_records_csv, export_records_ndjson
+from .write_buffer import CommitTokenMixin, record_buffer
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import update_last_login
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import F, Prefetch, Sum
+from django.db.models.functions import TruncDay
 from drf_spectacular.utils import extend_schema, OpenApiExample
 
 CustomUser = get_user_model()
 
+
+def active_records_prefetch():
+    return Prefetch('records', queryset=RecordsModel.objects.filter(is_active=True), to_attr='active_records')
+
+
+def active_warehouses_prefetch(with_records=True, with_stock=False):
+    warehouses = Warehouse.objects.filter(is_active=True)
+    if with_records:
+        warehouses = warehouses.prefetch_related(active_records_prefetch())
+    if with_stock:
+        warehouses = warehouses.select_related('stock')
+    return Prefetch('warehouses', queryset=warehouses, to_attr='active_warehouses')
+
 ###login
 
 class LoginView(TokenObtainPairView, BaseView):
     serializer_class = LoginRequestSerializer
 
+    @extend_schema(request=LoginRequestSerializer, responses=LoginResponseSerializer)
     def post(self, request, *args, **kwargs):
         request_serializer = self.serializer_class(data=request.data)
         if not request_serializer.is_valid():
             return self.error_response(request_serializer.errors)
+        username = request_serializer.validated_data['username']
+        password = request_serializer.validated_data['password']
         try:
-            user = CustomUser.objects.get(username=request.data['username'])
-            if user.is_superuser or (user.is_active and hasattr(user, 'client') and user.client.is_active):
-                token_serializer = TokenObtainPairSerializer(data=request.data)
-                token_serializer.is_valid(raise_exception=True)
-            else:
+            user = CustomUser.objects.select_related('client').filter(username=username).first()
+            if user is None:
+                # Hash once anyway so unknown usernames cost the same as wrong passwords.
+                CustomUser().set_password(password)
+                return self.error_response("Invalid credentials.", status_code=status.HTTP_401_UNAUTHORIZED)
+            if not user.check_password(password):
+                return self.error_response("Invalid credentials.", status_code=status.HTTP_401_UNAUTHORIZED)
+            client = getattr(user, 'client', None)
+            if not user.is_active or not (user.is_superuser or (client is not None and client.is_active)):
                 return self.error_response("This account is inactive.", status_code=status.HTTP_403_FORBIDDEN)
-        except CustomUser.DoesNotExist:
-            return self.error_response("Invalid credentials.", status_code=status.HTTP_401_UNAUTHORIZED)
+
+            refresh = RefreshToken.for_user(user)
+            if jwt_settings.UPDATE_LAST_LOGIN:
+                update_last_login(None, user)
         except Exception as e:
             return self.error_response(str(e))
 
-        response_data = {
-            'access': token_serializer.validated_data['access'],
-            'refresh': token_serializer.validated_data['refresh'],
-            'user_id': str(user.id),
+        response_serializer = LoginResponseSerializer({
+            'access': str(refresh.access_token),
+            'refresh': str(refresh),
+            'user_id': user.id,
             'username': user.username
-        }
-        response_serializer = LoginResponseSerializer(data=response_data)
-        if response_serializer.is_valid():
-            return Response(response_serializer.data, status=status.HTTP_200_OK)
-        else:
-            return self.error_response(response_serializer.errors)
+        })
+        return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 ### logout
 
@@ -63,13 +102,24 @@ class LogoutView(BaseView):
             return self.error_response(str(e))
 
 
+class CachedTokenBlacklistView(TokenBlacklistView):
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            token = RefreshToken(request.data['refresh'], verify=False)
+            invalidate_user_snapshot(token[jwt_settings.USER_ID_CLAIM])
+        return response
+
+
 #### Client
 @extend_schema(tags=['Clients'])
-class ClientViewSet(BaseView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin,
-                    mixins.ListModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+class ClientViewSet(CachedReadMixin, ReplicaReadMixin, SparseFieldsMixin, BaseView, mixins.RetrieveModelMixin,
+                    mixins.UpdateModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
     queryset = Client.objects.all() 
     serializer_class = ClientSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
+    pagination_class = ClientCursorPagination
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -80,9 +130,16 @@ class ClientViewSet(BaseView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin
 
     def get_queryset(self):
         user = self.request.user
+        expand = self.requested_expansions()
+        queryset = Client.objects.all()
+        if self.wants_field('username') or 'warehouses' in expand:
+            queryset = queryset.select_related('user')
+        if 'warehouses' in expand and self.wants_field('warehouses'):
+            queryset = queryset.prefetch_related(active_warehouses_prefetch(
+                with_records='records' in expand, with_stock='stock' in expand))
         if user.is_staff:
-            return Client.objects.filter(is_active=True, user__is_active=True)
-        return Client.objects.filter(user=user, is_active=True, user__is_active=True)
+            return queryset.filter(is_active=True, user__is_active=True)
+        return queryset.filter(user=user, is_active=True, user__is_active=True)
 
     @extend_schema(
         request=ClientSerializer,
@@ -153,7 +210,7 @@ class ClientViewSet(BaseView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin
                 if instance.is_active:
                     refresh_token = request.data.get("refresh")
                     if refresh_token:
-                        token = RefreshToken(refresh_token)
+                        token = FilteredRefreshToken(refresh_token)
                         token.blacklist()
                     instance.is_active = False
                     instance.save()
@@ -170,7 +227,7 @@ class ClientViewSet(BaseView, mixins.RetrieveModelMixin, mixins.UpdateModelMixin
 class RegisterUserView(BaseView, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = RegisterRequestSerializer
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAdminUser]
 
     def perform_create(self, serializer):
@@ -183,22 +240,50 @@ class RegisterUserView(BaseView, viewsets.ModelViewSet):
 
 ### Warehouse
 @extend_schema(tags=['Warehouse'])
-class WarehouseViewSet(BaseView, viewsets.ModelViewSet):
+class WarehouseViewSet(CachedReadMixin, ReplicaReadMixin, CommitTokenMixin, ValuesListMixin, SparseFieldsMixin, BaseView, viewsets.ModelViewSet):
     queryset = Warehouse.objects.all()
     serializer_class = WarehouseSerializer
+    pagination_class = WarehouseCursorPagination
+    replica_actions = ('list', 'retrieve', 'stock')
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'stock']:
             permission_classes = [IsAuthenticated]
         else:
             permission_classes = [IsAdminUser]
         return [permission() for permission in permission_classes]
 
+    def requested_expansions(self):
+        expand = super().requested_expansions()
+        # ?include_stock=true predates ?expand=stock, kept as its alias for one release
+        if self.request.query_params.get('include_stock', '').lower() in ('1', 'true'):
+            expand = expand | {'stock'}
+        return expand
+
     def get_queryset(self):
         user = self.request.user
+        expand = self.requested_expansions()
+        queryset = Warehouse.objects.all()
+        if self.wants_field('username', 'id_client'):
+            queryset = queryset.select_related('client__user')
+        if 'records' in expand and self.wants_field('records'):
+            queryset = queryset.prefetch_related(active_records_prefetch())
+        if 'stock' in expand and self.wants_field('stock'):
+            queryset = queryset.select_related('stock')
+        # The client flag hides the warehouses of a client whose deactivation is still running.
         if user.is_staff:
-            return Warehouse.objects.filter(is_active=True) 
-        return Warehouse.objects.filter(client__user=user, is_active=True)
+            return queryset.filter(is_active=True, client__is_active=True)
+        return queryset.filter(client__user=user, is_active=True, client__is_active=True)
+
+    @extend_schema(responses=StockBalanceSerializer)
+    @action(detail=True, methods=['get'])
+    def stock(self, request, *args, **kwargs):
+        return self.cached_response(self.stock_response, request, *args, **kwargs)
+
+    def stock_response(self, request, *args, **kwargs):
+        warehouse = self.get_object()
+        balance = StockBalance.objects.filter(warehouse=warehouse).first() or StockBalance(warehouse=warehouse)
+        return Response(StockBalanceSerializer(balance).data, status=status.HTTP_200_OK)
     
     @extend_schema(
         request=WarehouseSerializer,
@@ -327,45 +412,154 @@ class WarehouseViewSet(BaseView, viewsets.ModelViewSet):
 
 )
 @extend_schema(tags=['Records'])
-class RecordsViewSet(BaseView, viewsets.ModelViewSet):
+class RecordsViewSet(CachedReadMixin, ReplicaReadMixin, CommitTokenMixin, ValuesListMixin, SparseFieldsMixin, BaseView, viewsets.ModelViewSet):
     queryset = RecordsModel.objects.filter(is_active=True)
     serializer_class = RecordsSerializer
+    pagination_class = RecordsCursorPagination
+    replica_actions = ('list', 'retrieve', 'export')
 
     def get_queryset(self):
         user = self.request.user
+        # Parent flags hide the records of a deactivation that is still running.
+        queryset = RecordsModel.objects.filter(is_active=True, warehouse__is_active=True, warehouse__client__is_active=True)
         if user.is_staff:
-            return RecordsModel.objects.filter(is_active=True)
-        return RecordsModel.objects.filter(warehouse__client__user=user, is_active=True, warehouse__is_active=True)
+            return queryset
+        return queryset.filter(warehouse__client__user=user)
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk']:
             permission_classes = [IsAdminUser]
         else:
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @extend_schema(responses={201: RecordsSerializer, 202: RecordsSerializer})
+    def create(self, request, *args, **kwargs):
+        if not settings.RECORDS_WRITE_BUFFER_ENABLED:
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        warehouse = serializer.validated_data['warehouse']
+        if not warehouse.is_active or not warehouse.client.is_active:
+            return self.error_response("Warehouse is inactive.", status_code=status.HTTP_403_FORBIDDEN)
+
+        now = timezone.now()
+        record = RecordsModel(warehouse=warehouse, type_record=serializer.validated_data['type_record'],
+                              quantity=serializer.validated_data['quantity'], created_at=now, updated_at=now)
+        record_buffer.append(record)
+        # Accepted once logged; send the token back as X-Commit-Token to read the record.
+        return Response(self.get_serializer(record).data, status=status.HTTP_202_ACCEPTED,
+                        headers={'X-Commit-Token': str(record.id_record)})
+
     def perform_create(self, serializer):
         warehouse_id = self.request.data.get('id_warehouse')
         
         try:
-            warehouse = Warehouse.objects.get(id=warehouse_id)
+            warehouse = Warehouse.objects.select_related('client').get(id=warehouse_id)
         except Warehouse.DoesNotExist:
             return self.error_response("Warehouse not found.", status_code=status.HTTP_404_NOT_FOUND)
         
-        if not warehouse.is_active:
+        if not warehouse.is_active or not warehouse.client.is_active:
             return self.error_response("Warehouse is inactive.", status_code=status.HTTP_403_FORBIDDEN)
         
         try:
-            serializer.save()
+            with transaction.atomic():
+                record = serializer.save()
+                apply_record_aggregates(record)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Exception as e:
             return self.error_response(str(e))
 
+    @extend_schema(request=RecordsBulkItemSerializer(many=True), responses=RecordsBulkResultSerializer(many=True))
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return self.error_response("Expected a non-empty list of records.")
+        if len(items) > settings.RECORDS_BULK_MAX_ITEMS:
+            return self.error_response(f"At most {settings.RECORDS_BULK_MAX_ITEMS} records can be sent at once.")
+
+        results, valid = [], []
+        for index, item in enumerate(items):
+            item_serializer = RecordsBulkItemSerializer(data=item)
+            if item_serializer.is_valid():
+                valid.append((index, item_serializer.validated_data))
+                results.append(None)
+            else:
+                results.append({'index': index, 'status': 'error', 'errors': item_serializer.errors})
+
+        warehouses = {warehouse_id: (is_active and client_is_active, client_id)
+                      for warehouse_id, is_active, client_is_active, client_id in
+                      Warehouse.objects.filter(id__in={data['id_warehouse'] for _, data in valid})
+                      .values_list('id', 'is_active', 'client__is_active', 'client_id')}
+        records = []
+        for index, data in valid:
+            is_active, _ = warehouses.get(data['id_warehouse'], (None, None))
+            if is_active is None:
+                results[index] = {'index': index, 'status': 'error', 'errors': {'id_warehouse': "Warehouse not found."}}
+            elif not is_active:
+                results[index] = {'index': index, 'status': 'error', 'errors': {'id_warehouse': "Warehouse is inactive."}}
+            else:
+                record = RecordsModel(warehouse_id=data['id_warehouse'], type_record=data['type_record'],
+                                      quantity=data['quantity'])
+                records.append(record)
+                results[index] = {'index': index, 'status': 'created', 'id_record': record.id_record}
+
+        if records:
+            try:
+                with transaction.atomic():
+                    RecordsModel.objects.bulk_create(records, batch_size=settings.RECORDS_BULK_BATCH_SIZE)
+                    add_records_aggregates(records)
+                    bump_client_versions(*{warehouses[record.warehouse_id][1] for record in records})
+            except Exception as e:
+                return self.error_response(str(e))
+
+        if len(records) == len(items):
+            status_code = status.HTTP_201_CREATED
+        elif records:
+            status_code = status.HTTP_207_MULTI_STATUS
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        return Response(RecordsBulkResultSerializer(results, many=True).data, status=status_code)
+
+    @extend_schema(parameters=[RecordsExportRequestSerializer], responses={(200, 'text/csv'): str, (200, 'application/x-ndjson'): str})
+    @action(detail=False, methods=['get'], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request, *args, **kwargs):
+        params = RecordsExportRequestSerializer(data=request.query_params)
+        if not params.is_valid():
+            return self.error_response(params.errors)
+        params = params.validated_data
+
+        records = self.get_queryset()
+        if 'id_warehouse' in params:
+            records = records.filter(warehouse_id=params['id_warehouse'])
+        if 'id_client' in params:
+            records = records.filter(warehouse__client_id=params['id_client'])
+        if 'start' in params:
+            records = records.filter(created_at__gte=params['start'])
+        if 'end' in params:
+            records = records.filter(created_at__lt=params['end'])
+        # Streamed after the view returned, when the reads are no longer routed
+        records = records.order_by('created_at', 'id_record').using(records.db)
+
+        renderer = request.accepted_renderer
+        export = export_records_csv if renderer.format == 'csv' else export_records_ndjson
+        response = StreamingHttpResponse(export(records, settings.RECORDS_EXPORT_CHUNK_SIZE),
+                                         content_type=f"{renderer.media_type}; charset=utf-8")
+        response['Content-Disposition'] = f'attachment; filename="records.{renderer.format}"'
+        return response
+
     def perform_update(self, serializer):
         record = self.get_object()
-        if record.warehouse.is_active:
+        if record.warehouse.is_active and record.warehouse.client.is_active:
             try:
-                serializer.save()
+                previous_warehouse_id = serializer.instance.warehouse_id
+                with transaction.atomic():
+                    record = serializer.save()
+                    if record.warehouse_id != previous_warehouse_id:
+                        apply_record_aggregates(record, sign=-1, warehouse_id=previous_warehouse_id)
+                        apply_record_aggregates(record)
                 return Response(serializer.data, status=status.HTTP_200_OK)
             except Exception as e:
                 return self.error_response(str(e))
@@ -376,8 +570,10 @@ class RecordsViewSet(BaseView, viewsets.ModelViewSet):
         record = self.get_object()
         if self.request.user.is_staff and record.is_active:  
             try:  
-               record.is_active = False
-               record.save()
+               with transaction.atomic():
+                   record.is_active = False
+                   record.save()
+                   apply_record_aggregates(record, sign=-1)
                return Response(status=status.HTTP_204_NO_CONTENT)
             except Exception as e:
                 return self.error_response(str(e)) 
@@ -385,4 +581,96 @@ class RecordsViewSet(BaseView, viewsets.ModelViewSet):
             return self.error_response("You do not have permission to delete this record or the record is inactive.", status_code=status.HTTP_403_FORBIDDEN)
 
 
-            
\ No newline at end of file
+            
+### Reports
+
+@extend_schema(tags=['Reports'], parameters=[MovementReportRequestSerializer], responses=MovementReportSerializer(many=True))
+class MovementReportView(ReplicaReadMixin, CommitTokenMixin, BaseView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = MovementReportSerializer
+    replica_actions = ('get',)
+
+    def get(self, request, *args, **kwargs):
+        params = MovementReportRequestSerializer(data=request.query_params)
+        if not params.is_valid():
+            return self.error_response(params.errors)
+        params = params.validated_data
+
+        rollups = MovementRollup.objects.filter(bucket__gte=params['start'], bucket__lt=params['end'],
+                                                warehouse__is_active=True, warehouse__client__is_active=True)
+        if not request.user.is_staff:
+            rollups = rollups.filter(warehouse__client__user=request.user)
+        if 'id_warehouse' in params:
+            rollups = rollups.filter(warehouse_id=params['id_warehouse'])
+        if 'id_client' in params:
+            rollups = rollups.filter(warehouse__client_id=params['id_client'])
+
+        period = TruncDay('bucket') if params['granularity'] == 'day' else F('bucket')
+        key, field = ('id_warehouse', 'warehouse_id') if params['group_by'] == 'warehouse' else ('id_client', 'warehouse__client_id')
+        rows = (rollups.annotate(period=period).values('period', field, 'type_record')
+                .annotate(quantity=Sum('total_quantity'), count=Sum('record_count'))
+                .order_by('period', field, 'type_record'))
+        data = [{
+            'bucket': row['period'],
+            key: row[field],
+            'type_record': row['type_record'],
+            'total_quantity': row['quantity'],
+            'record_count': row['count'],
+        } for row in rows if row['count']]
+        return Response(MovementReportSerializer(data, many=True).data, status=status.HTTP_200_OK)
+
+### Sync
+
+@extend_schema(tags=['Sync'], parameters=[SyncRequestSerializer], responses=SyncResponseSerializer)
+class SyncView(BaseView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = SyncResponseSerializer
+
+    def get(self, request, *args, **kwargs):
+        params = SyncRequestSerializer(data=request.query_params)
+        if not params.is_valid():
+            return self.error_response(params.errors)
+        limit = min(params.validated_data.get('limit', settings.SYNC_PAGE_SIZE), settings.API_MAX_PAGE_SIZE)
+        try:
+            data = changes_since(request.user, params.validated_data.get('since'), limit)
+        except InvalidCursor as e:
+            return self.error_response(str(e))
+        return Response(data, status=status.HTTP_200_OK)
+
+### Deactivations
+
+@extend_schema(tags=['Deactivations'])
+class DeactivationJobViewSet(BaseView, viewsets.ReadOnlyModelViewSet):
+    """Progress of the cascades queued by deleting a client or a warehouse."""
+    serializer_class = DeactivationJobSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = DeactivationJobCursorPagination
+
+    filters = {}
+
+    @extend_schema(parameters=[DeactivationJobFilterSerializer])
+    def list(self, request, *args, **kwargs):
+        params = DeactivationJobFilterSerializer(data=request.query_params)
+        if not params.is_valid():
+            return self.error_response(params.errors)
+        self.filters = params.validated_data
+        return super().list(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = DeactivationJob.objects.all()
+        if 'id_client' in self.filters:
+            queryset = queryset.filter(client_id=self.filters['id_client'])
+        if 'id_warehouse' in self.filters:
+            queryset = queryset.filter(warehouse_id=self.filters['id_warehouse'])
+        return queryset
+
+### Metrics
+
+@extend_schema(tags=['Metrics'], responses={(200, 'text/plain'): str})
+class MetricsView(BaseView):
+    """Per-view latency, SQL query and response size metrics of every worker, for Prometheus."""
+    permission_classes = [IsAdminUser]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.render(), status=status.HTTP_200_OK)
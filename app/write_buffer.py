@@ -0,0 +1,293 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from rest_framework import exceptions, status
+from rest_framework.permissions import SAFE_METHODS
+from utils.cache import bump_client_versions, response_cache
+from .models import RecordsModel, Warehouse, add_records_aggregates
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two looks for the segments of dead processes
+REPLAY_INTERVAL = 5
+# Seconds a dropped record is remembered, for the reads sent with its commit token
+DROPPED_TIMEOUT = 24 * 3600
+
+
+def dropped_key(record_id):
+    return f"record-dropped:{record_id}"
+
+
+def dropped_ids(ids):
+    """:return: The ids among ids that a commit dropped instead of inserting."""
+    return {key.split(':', 1)[1] for key in response_cache().get_many([dropped_key(pk) for pk in ids])}
+
+
+def record_entry(record):
+    return {
+        'id_record': str(record.id_record),
+        'warehouse_id': str(record.warehouse_id),
+        'type_record': record.type_record,
+        'quantity': record.quantity,
+        'created_at': record.created_at.isoformat(),
+    }
+
+
+def commit_entries(entries):
+    """
+    Inserts the logged records in one transaction, with their stock balances and rollups.
+    Records already in the table are skipped, so a segment can be replayed any number of times.
+    Records of a warehouse deactivated since they were acknowledged are stored inactive.
+    :return: Number of records inserted.
+    """
+    with transaction.atomic():
+        ids = [entry['id_record'] for entry in entries]
+        existing = {str(pk) for pk in RecordsModel.objects.filter(pk__in=ids).values_list('pk', flat=True)}
+        warehouses = {str(warehouse_id): (is_active and client_is_active, client_id)
+                      for warehouse_id, is_active, client_is_active, client_id in
+                      Warehouse.objects.filter(id__in={entry['warehouse_id'] for entry in entries})
+                      .values_list('id', 'is_active', 'client__is_active', 'client_id')}
+        records, seen, dropped = [], set(), []
+        for entry in entries:
+            if entry['id_record'] in existing or entry['id_record'] in seen:
+                continue
+            if entry['warehouse_id'] not in warehouses:
+                logger.error("Dropping buffered record %s of missing warehouse %s.",
+                             entry['id_record'], entry['warehouse_id'])
+                dropped.append(entry['id_record'])
+                continue
+            seen.add(entry['id_record'])
+            records.append(RecordsModel(
+                id_record=entry['id_record'], warehouse_id=entry['warehouse_id'], type_record=entry['type_record'],
+                quantity=entry['quantity'], created_at=datetime.fromisoformat(entry['created_at']),
+                is_active=warehouses[entry['warehouse_id']][0]))
+        if records:
+            # auto_now_add stamps the insert time; the logged times are written back in the same
+            # transaction, since toggling the shared field would affect the request threads.
+            created_at = [record.created_at for record in records]
+            RecordsModel.objects.bulk_create(records, batch_size=settings.RECORDS_BULK_BATCH_SIZE)
+            for record, logged_at in zip(records, created_at):
+                record.created_at = logged_at
+            RecordsModel.objects.bulk_update(records, ['created_at'], batch_size=settings.RECORDS_BULK_BATCH_SIZE)
+            add_records_aggregates([record for record in records if record.is_active])
+            bump_client_versions(*{warehouses[str(record.warehouse_id)][1] for record in records})
+        if dropped:
+            # In the shared cache, so the worker answering the token's read learns it too
+            cache = response_cache()
+            transaction.on_commit(lambda: cache.set_many(
+                {dropped_key(pk): True for pk in dropped}, DROPPED_TIMEOUT))
+    return len(records)
+
+
+def read_segment(path):
+    """Yields the entries of a segment; a line torn by a crash ends it."""
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RecordWriteBuffer:
+    """
+    Write-behind buffer of the records created through the API. append() writes the
+    record to this process's segment of the append-only log and fsyncs it before the
+    request is acknowledged; a flusher thread group-commits the pending records every
+    RECORDS_WRITE_BUFFER_FLUSH_MS, or as soon as RECORDS_WRITE_BUFFER_MAX_ROWS are
+    waiting, then deletes the segment. Segments are named <pid>-<uuid>.log; those of
+    dead processes, and those whose commit failed, are replayed by replay_orphans().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._segment = None
+        self._owned = set()
+        self._thread = None
+        self._replayed_at = 0
+
+    def directory(self):
+        return str(settings.RECORDS_WRITE_BUFFER_DIR)
+
+    def append(self, record):
+        line = (json.dumps(record_entry(record)) + '\n').encode()
+        with self._lock:
+            if self._segment is None:
+                os.makedirs(self.directory(), exist_ok=True)
+                path = os.path.join(self.directory(), f'{os.getpid()}-{uuid.uuid4().hex}.log')
+                self._segment = (path, os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600))
+                self._owned.add(path)
+            os.write(self._segment[1], line)
+            if settings.RECORDS_WRITE_BUFFER_FSYNC:
+                os.fsync(self._segment[1])
+            self._pending.append(json.loads(line))
+            if len(self._pending) >= settings.RECORDS_WRITE_BUFFER_MAX_ROWS:
+                self._wakeup.notify()
+        self.start()
+
+    def pending_ids(self):
+        with self._lock:
+            return {entry['id_record'] for entry in self._pending}
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self.run, name='record-write-buffer', daemon=True)
+                    self._thread.start()
+
+    def run(self):
+        while True:
+            with self._lock:
+                if len(self._pending) < settings.RECORDS_WRITE_BUFFER_MAX_ROWS:
+                    self._wakeup.wait(settings.RECORDS_WRITE_BUFFER_FLUSH_MS / 1000)
+            try:
+                self.flush()
+                if time.monotonic() - self._replayed_at >= REPLAY_INTERVAL:
+                    self.replay_orphans()
+            except Exception:
+                logger.exception("Record write buffer flush failed.")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """
+        Commits the pending records now. On failure the segment is left for replay_orphans().
+        :return: Number of records inserted.
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries, segment = self._pending, self._segment
+                self._pending, self._segment = [], None
+            if segment is None:
+                return 0
+            path, fd = segment
+            os.close(fd)
+            try:
+                inserted = commit_entries(entries) if entries else 0
+            except Exception:
+                with self._lock:
+                    self._owned.discard(path)
+                raise
+            os.unlink(path)
+            with self._lock:
+                self._owned.discard(path)
+            return inserted
+
+    def replay_orphans(self):
+        """
+        Commits the segments left by dead processes or by failed flushes of this one.
+        A segment is claimed with a rename first, so two processes never replay it together.
+        :return: Number of records inserted.
+        """
+        self._replayed_at = time.monotonic()
+        inserted = 0
+        for path in sorted(glob.glob(os.path.join(self.directory(), '*.log'))):
+            pid = int(os.path.basename(path).split('-')[0])
+            with self._lock:
+                if path in self._owned or (pid != os.getpid() and process_alive(pid)):
+                    continue
+                claimed = os.path.join(self.directory(), f'{os.getpid()}-{uuid.uuid4().hex}.log')
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                self._owned.add(claimed)
+            try:
+                entries = list(read_segment(claimed))
+                inserted += commit_entries(entries) if entries else 0
+                os.unlink(claimed)
+            finally:
+                with self._lock:
+                    self._owned.discard(claimed)
+        return inserted
+
+    def wait_for(self, ids, queryset, timeout):
+        """
+        Waits until the records are committed to queryset or dropped, flushing this
+        process's buffer first when it holds any of them.
+        :return: The ids that were dropped, None if the timeout expired first.
+        """
+        ids = set(ids)
+        if self.pending_ids() & ids:
+            self.flush()
+        deadline = time.monotonic() + timeout
+        while True:
+            dropped = dropped_ids(ids)
+            if queryset.filter(pk__in=ids - dropped).count() == len(ids - dropped):
+                return dropped
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.01)
+
+
+record_buffer = RecordWriteBuffer()
+
+
+class WritesPending(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The records of the commit token are not committed yet, retry later."
+    default_code = 'writes_pending'
+
+
+class WritesDropped(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Some records of the commit token were not stored, their warehouse no longer exists."
+    default_code = 'writes_dropped'
+
+
+class CommitTokenMixin:
+    """
+    Makes a read sent with the X-Commit-Token header of buffered creates (comma
+    separated when there are several) wait until those records are committed, so
+    a client always reads its own writes. Goes after ReplicaReadMixin in the bases:
+    the commit marks the scope as written, which keeps the read on the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        header = request.headers.get('X-Commit-Token')
+        if not header or request.method not in SAFE_METHODS:
+            return
+        try:
+            ids = [str(uuid.UUID(token.strip())) for token in header.split(',')]
+        except ValueError:
+            raise exceptions.ValidationError({'X-Commit-Token': "Invalid commit token."})
+        user = request.user
+        # Inactive records count too, they are committed; other clients' records never do.
+        queryset = RecordsModel.objects.all() if user.is_staff else RecordsModel.objects.filter(
+            warehouse__client__user=user)
+        dropped = record_buffer.wait_for(ids, queryset, settings.RECORDS_WRITE_BUFFER_WAIT_TIMEOUT)
+        if dropped is None:
+            raise WritesPending()
+        if dropped:
+            raise WritesDropped()
+
+
+@atexit.register
+def flush_on_exit():
+    try:
+        record_buffer.flush()
+    except Exception:
+        logger.exception("Record write buffer flush at exit failed, the segment is replayed later.")
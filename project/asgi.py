@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# Serve the read-heavy endpoints with the async views, see project/asgi_urls.py.
+os.environ.setdefault('ROOT_URLCONF', 'project.asgi_urls')
+# Each request runs its ORM calls on its own thread, persistent connections would pile up.
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -0,0 +1,15 @@
+"""
+URLconf of the ASGI deployment: the read-heavy endpoints are answered by async
+views, every other route is the regular one from project.urls.
+"""
+from django.urls import include, path, re_path
+from app.async_views import AsyncReadView
+from app.views import WarehouseViewSet, RecordsViewSet
+
+urlpatterns = [
+    re_path(r'^api/warehouses/$', AsyncReadView.as_view(viewset=WarehouseViewSet, action='list')),
+    re_path(r'^api/warehouses/(?P<pk>[^/.]+)/$', AsyncReadView.as_view(viewset=WarehouseViewSet, action='retrieve')),
+    re_path(r'^api/warehouses/(?P<pk>[^/.]+)/stock/$', AsyncReadView.as_view(viewset=WarehouseViewSet, action='stock')),
+    re_path(r'^api/records/$', AsyncReadView.as_view(viewset=RecordsViewSet, action='list')),
+    path('', include('project.urls')),
+]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from decouple import config
@@ -21,9 +22,36 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": config("DATABASE_NAME", default="db.sqlite3"),
+        "CONN_MAX_AGE": config("DATABASE_CONN_MAX_AGE", default=600, cast=int),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Read-only copy of the primary refreshed by manage.py sync_replica, see utils.replica.
+# The read actions of the viewsets use it while it is at most DATABASE_REPLICA_MAX_LAG seconds behind.
+DATABASE_REPLICA_NAME = config("DATABASE_REPLICA_NAME", default="")
+DATABASE_REPLICA_MAX_LAG = config("DATABASE_REPLICA_MAX_LAG", default=5, cast=float)
+DATABASES["replica"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": f"file:{DATABASE_REPLICA_NAME or 'replica.sqlite3'}?mode=ro",
+    # The replica file is replaced on every sync, new connections pick up the new copy
+    "CONN_MAX_AGE": 0,
+    "TEST": {"MIRROR": "default"},
+}
+DATABASE_ROUTERS = ["utils.replica.ReplicaRouter"]
+
+# Applied to every new SQLite connection by utils.sqlite.apply_sqlite_pragmas
+SQLITE_TUNING = {
+    "ENABLED": config("SQLITE_TUNING", default=True, cast=bool),
+    "JOURNAL_MODE": config("SQLITE_JOURNAL_MODE", default="WAL"),
+    "SYNCHRONOUS": config("SQLITE_SYNCHRONOUS", default="NORMAL"),
+    "MMAP_SIZE": config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    # negative values are KiB, so this is a 64 MiB page cache per connection
+    "CACHE_SIZE": config("SQLITE_CACHE_SIZE", default=-64000, cast=int),
+    "BUSY_TIMEOUT": config("SQLITE_BUSY_TIMEOUT", default=5000, cast=int),
+    "TEMP_STORE": config("SQLITE_TEMP_STORE", default="MEMORY"),
+}
+
 AUTH_USER_MODEL = "app.CustomUser"
 
 
@@ -62,6 +90,8 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    "utils.metrics.MetricsMiddleware",
+    "utils.slow_queries.SlowQueryMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -72,7 +102,7 @@ MIDDLEWARE = [
 ]
 
 
-ROOT_URLCONF = "project.urls"
+ROOT_URLCONF = config("ROOT_URLCONF", default="project.urls")
 
 TEMPLATES = [
     {
@@ -140,7 +170,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "utils.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -148,6 +178,68 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "default",
+    },
+    "auth": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "auth-snapshots",
+        "OPTIONS": {"MAX_ENTRIES": config("AUTH_USER_CACHE_MAX_ENTRIES", default=10000, cast=int)},
+    },
+    # Must be shared by all worker processes (e.g. file based or Redis) when running more than one.
+    "api": {
+        "BACKEND": config("API_RESPONSE_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("API_RESPONSE_CACHE_LOCATION", default="api-responses"),
+    },
+}
+
+AUTH_USER_CACHE = "auth"
+AUTH_USER_CACHE_TIMEOUT = config("AUTH_USER_CACHE_TIMEOUT", default=300, cast=int)
+
+API_RESPONSE_CACHE = "api"
+API_RESPONSE_CACHE_ENABLED = config("API_RESPONSE_CACHE_ENABLED", default=True, cast=bool)
+API_RESPONSE_CACHE_TIMEOUT = config("API_RESPONSE_CACHE_TIMEOUT", default=300, cast=int)
+
+API_PAGE_SIZE = config("API_PAGE_SIZE", default=100, cast=int)
+API_MAX_PAGE_SIZE = config("API_MAX_PAGE_SIZE", default=1000, cast=int)
+SYNC_PAGE_SIZE = config("SYNC_PAGE_SIZE", default=500, cast=int)
+# /api/sync/ holds back the rows stamped less than SQLITE_BUSY_TIMEOUT + SYNC_SETTLE_SECONDS ago, see
+# app.sync.settle_seconds. Invariant: every write transaction commits within that long of stamping
+# updated_at (lock wait included), or a client can miss the change; keep transactions shorter than
+# SYNC_SETTLE_SECONDS and raise it along with the busy timeout.
+SYNC_SETTLE_SECONDS = config("SYNC_SETTLE_SECONDS", default=2, cast=float)
+RECORDS_BULK_MAX_ITEMS = config("RECORDS_BULK_MAX_ITEMS", default=10000, cast=int)
+RECORDS_BULK_BATCH_SIZE = config("RECORDS_BULK_BATCH_SIZE", default=500, cast=int)
+RECORDS_EXPORT_CHUNK_SIZE = config("RECORDS_EXPORT_CHUNK_SIZE", default=2000, cast=int)
+
+# Write-behind mode of POST /api/records/, see app.write_buffer.RecordWriteBuffer
+RECORDS_WRITE_BUFFER_ENABLED = config("RECORDS_WRITE_BUFFER_ENABLED", default=False, cast=bool)
+RECORDS_WRITE_BUFFER_DIR = config("RECORDS_WRITE_BUFFER_DIR", default=str(BASE_DIR / "logs" / "record-buffer"))
+RECORDS_WRITE_BUFFER_FLUSH_MS = config("RECORDS_WRITE_BUFFER_FLUSH_MS", default=50, cast=int)
+RECORDS_WRITE_BUFFER_MAX_ROWS = config("RECORDS_WRITE_BUFFER_MAX_ROWS", default=500, cast=int)
+RECORDS_WRITE_BUFFER_FSYNC = config("RECORDS_WRITE_BUFFER_FSYNC", default=True, cast=bool)
+# How long a read sent with X-Commit-Token waits for its records before answering 503
+RECORDS_WRITE_BUFFER_WAIT_TIMEOUT = config("RECORDS_WRITE_BUFFER_WAIT_TIMEOUT", default=5, cast=float)
+
+# Cascades queued by deactivating a client or warehouse, see process_deactivations
+DEACTIVATION_BATCH_SIZE = config("DEACTIVATION_BATCH_SIZE", default=1000, cast=int)
+DEACTIVATION_STALE_SECONDS = config("DEACTIVATION_STALE_SECONDS", default=300, cast=int)
+
+# Per-view request metrics served at /api/metrics, one file per worker process in METRICS_DIR
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+METRICS_DIR = config("METRICS_DIR", default=str(Path(tempfile.gettempdir()) / "next4-metrics"))
+METRICS_FLUSH_INTERVAL = config("METRICS_FLUSH_INTERVAL", default=5, cast=float)
+
+# Queries slower than the threshold are written with their EXPLAIN QUERY PLAN by
+# utils.slow_queries.log_slow_queries, see manage.py slow_queries
+SLOW_QUERY_LOG_ENABLED = config("SLOW_QUERY_LOG_ENABLED", default=False, cast=bool)
+SLOW_QUERY_THRESHOLD_MS = config("SLOW_QUERY_THRESHOLD_MS", default=100, cast=float)
+SLOW_QUERY_LOG_FILE = config("SLOW_QUERY_LOG_FILE", default=str(BASE_DIR / "logs" / "slow_queries.jsonl"))
+SLOW_QUERY_LOG_MAX_BYTES = config("SLOW_QUERY_LOG_MAX_BYTES", default=10 * 1024 * 1024, cast=int)
+SLOW_QUERY_LOG_BACKUP_COUNT = config("SLOW_QUERY_LOG_BACKUP_COUNT", default=5, cast=int)
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "API NEXT4 v2.0",
     "DESCRIPTION": "Documentación de la API de next4",
@@ -155,6 +247,13 @@ SPECTACULAR_SETTINGS = {
     # 'SERVE_INCLUDE_SCHEMA': False,  # Uncomment if you want to exclude the schema endpoint
 }
 
+# /api/schema/ is generated once per code version, see utils.schema.SchemaCache and manage.py generate_schema
+API_SCHEMA_CACHE_ENABLED = config("API_SCHEMA_CACHE_ENABLED", default=True, cast=bool)
+API_SCHEMA_CACHE_DIR = config("API_SCHEMA_CACHE_DIR", default=str(Path(tempfile.gettempdir()) / "next4-schema"))
+API_SCHEMA_CACHE_MAX_AGE = config("API_SCHEMA_CACHE_MAX_AGE", default=300, cast=int)
+# Set to the release commit to skip hashing the sources at startup
+API_SCHEMA_VERSION = config("API_SCHEMA_VERSION", default="")
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=10),
@@ -165,4 +264,10 @@ SIMPLE_JWT = {
     "SIGNING_KEY": SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
     "BLACKLIST_ENABLED": True,
+    "TOKEN_REFRESH_SERIALIZER": "utils.tokens.FilteredTokenRefreshSerializer",
+    "TOKEN_BLACKLIST_SERIALIZER": "utils.tokens.FilteredTokenBlacklistSerializer",
 }
+
+# How stale the in-process blacklist filter may get with respect to tokens
+# blacklisted by other worker processes.
+JWT_BLACKLIST_FILTER_SYNC_INTERVAL = config("JWT_BLACKLIST_FILTER_SYNC_INTERVAL", default=2, cast=float)
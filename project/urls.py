@@ -1,19 +1,19 @@
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework_simplejwt.views import TokenRefreshView, TokenBlacklistView
-from app.views import LoginView
+from rest_framework_simplejwt.views import TokenRefreshView
+from app.views import LoginView, CachedTokenBlacklistView
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
+from utils.schema import CachedSchemaView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/login/", LoginView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-    path("api/logout/", TokenBlacklistView.as_view(), name="token_blacklist"),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/logout/", CachedTokenBlacklistView.as_view(), name="token_blacklist"),
+    path("api/schema/", CachedSchemaView.as_view(), name="schema"),
     path(
         "api/docs/",
         SpectacularSwaggerView.as_view(url_name="schema"),
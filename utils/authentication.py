@@ -0,0 +1,109 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+SNAPSHOT_FIELDS = ('username', 'is_staff', 'is_superuser', 'is_active')
+
+
+def snapshot_key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def invalidate_user_snapshot(user_id):
+    caches[settings.AUTH_USER_CACHE].delete(snapshot_key(user_id))
+
+
+def load_user_snapshot(user_id):
+    """
+    Compact authorization snapshot of a user, built with a single query.
+    :return: Dict with the SNAPSHOT_FIELDS, the user id and the client active flag, or None.
+    """
+    return snapshot_from_user(snapshot_queryset(user_id).first())
+
+
+async def aload_user_snapshot(user_id):
+    """
+    Async counterpart of load_user_snapshot.
+    """
+    return snapshot_from_user(await snapshot_queryset(user_id).afirst())
+
+
+def snapshot_queryset(user_id):
+    User = get_user_model()
+    return User.objects.select_related('client').filter(**{api_settings.USER_ID_FIELD: user_id})
+
+
+def snapshot_from_user(user):
+    if user is None:
+        return None
+    snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+    snapshot['id'] = user.pk
+    snapshot['client_is_active'] = user.client.is_active if hasattr(user, 'client') else None
+    return snapshot
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from a local-memory snapshot
+    cache instead of loading the user row on every request.
+    Snapshots are dropped on user/client saves and on logout; as the cache is per
+    process, other workers see a change at the latest after AUTH_USER_CACHE_TIMEOUT.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.token_user_id(validated_token)
+        cache = caches[settings.AUTH_USER_CACHE]
+        snapshot = cache.get(snapshot_key(user_id))
+        if snapshot is None:
+            snapshot = load_user_snapshot(user_id)
+            self.store_snapshot(user_id, snapshot)
+        return self.user_from_snapshot(snapshot)
+
+    async def aauthenticate(self, request):
+        """
+        Async counterpart of authenticate, used by the async read views.
+        Only a snapshot cache miss touches the database.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.token_user_id(validated_token)
+        # The snapshot cache is local memory, reading it does not block.
+        cache = caches[settings.AUTH_USER_CACHE]
+        snapshot = cache.get(snapshot_key(user_id))
+        if snapshot is None:
+            snapshot = await aload_user_snapshot(user_id)
+            self.store_snapshot(user_id, snapshot)
+        return self.user_from_snapshot(snapshot)
+
+    def token_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def store_snapshot(self, user_id, snapshot):
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        caches[settings.AUTH_USER_CACHE].set(snapshot_key(user_id), snapshot, settings.AUTH_USER_CACHE_TIMEOUT)
+
+    def user_from_snapshot(self, snapshot):
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        User = get_user_model()
+        user = User(pk=snapshot['id'], **{field: snapshot[field] for field in SNAPSHOT_FIELDS})
+        user._state.adding = False
+        user._state.db = 'default'
+        user.client_is_active = snapshot['client_is_active']
+        return user
@@ -0,0 +1,120 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+STAFF_SCOPE = 'staff'
+
+
+def response_cache():
+    return caches[settings.API_RESPONSE_CACHE]
+
+
+def client_scope(client_id):
+    return f"client:{client_id}"
+
+
+def user_scope(user):
+    return STAFF_SCOPE if user.is_staff else client_scope(user.pk)
+
+
+def version_key(scope):
+    return f"api-version:{scope}"
+
+
+def written_key(scope):
+    return f"api-written:{scope}"
+
+
+def scope_version(scope):
+    cache = response_cache()
+    version = cache.get(version_key(scope))
+    if version is None:
+        # Seeded with the clock so an evicted counter never reuses an old version.
+        cache.add(version_key(scope), time.time_ns(), None)
+        version = cache.get(version_key(scope))
+    return version
+
+
+def bump_versions(scopes):
+    cache = response_cache()
+    for scope in scopes:
+        key = version_key(scope)
+        if not cache.add(key, time.time_ns(), None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), None)
+
+
+def bump_client_versions(*client_ids):
+    """
+    Invalidates the cached responses of the given clients and of staff users,
+    whose listings span every client. The versions are bumped now and again once
+    the transaction commits: a read between the two still sees the previously
+    committed rows, and must not stay cached under the version of this write.
+    """
+    scopes = [STAFF_SCOPE] + [client_scope(client_id) for client_id in client_ids if client_id]
+    bump_versions(scopes)
+
+    def committed():
+        bump_versions(scopes)
+        # Read by utils.replica.read_database, once the write is visible to a replica sync
+        response_cache().set_many({written_key(scope): time.time() for scope in scopes}, None)
+    transaction.on_commit(committed)
+
+
+class CachedReadMixin:
+    """
+    Caches the data of read actions per user scope (staff, or each client) and
+    query string. Keys embed the scope's version counter, so a bump from the
+    model signals invalidates every response of that scope at once. The ETag is
+    derived from the key, so a matching If-None-Match is answered with a 304
+    before anything is loaded or serialized.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def response_scope(self, user):
+        return user_scope(user)
+
+    def response_cache_key(self, request, kwargs):
+        """
+        :return: Tuple of the cache key of the response and the headers to send with it.
+        """
+        scope = self.response_scope(request.user)
+        parts = [
+            type(self).__name__, self.action, scope, str(scope_version(scope)),
+            repr(sorted(kwargs.items())), request.path, repr(sorted(request.query_params.lists())),
+            getattr(request.accepted_renderer, 'format', ''),
+        ]
+        key = 'api-response:' + hashlib.sha256('|'.join(parts).encode()).hexdigest()
+        etag = f'"{key[-32:]}"'
+        return key, {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Authorization'}
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not settings.API_RESPONSE_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        key, headers = self.response_cache_key(request, kwargs)
+        if headers['ETag'] in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = response_cache()
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data, settings.API_RESPONSE_CACHE_TIMEOUT)
+            for header, value in headers.items():
+                response[header] = value
+            return response
+        return Response(data, status=status.HTTP_200_OK, headers=headers)
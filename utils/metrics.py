@@ -0,0 +1,228 @@
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from asgiref.sync import iscoroutinefunction
+from contextvars import ContextVar
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+# name -> (help, upper bounds of the buckets)
+HISTOGRAMS = {
+    'api_request_duration_seconds': (
+        "Request latency per view.", (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'api_request_queries': (
+        "SQL queries run per request.", (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+    'api_response_size_bytes': (
+        "Response body size per view.", (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)),
+}
+
+# QueryRecorder of the request being served in this context
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def _empty_series():
+    series = {'status': {}, 'query_seconds': 0.0}
+    for name, (_, bounds) in HISTOGRAMS.items():
+        series[name] = {'buckets': [0] * (len(bounds) + 1), 'sum': 0}
+    return series
+
+
+def _merge(total, series):
+    for status, count in series['status'].items():
+        total['status'][status] = total['status'].get(status, 0) + count
+    total['query_seconds'] += series['query_seconds']
+    for name in HISTOGRAMS:
+        histogram = total[name]
+        histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], series[name]['buckets'])]
+        histogram['sum'] += series[name]['sum']
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    Per-view request metrics of this process. observe() only holds the lock for a
+    few additions; every METRICS_FLUSH_INTERVAL seconds the totals are written to
+    METRICS_DIR/metrics-<pid>.json with an atomic rename, and collect() sums the
+    files of every process, so the workers never share a lock.
+    Totals are cumulative per process; clear METRICS_DIR when deploying.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+            self._flushed_at = time.monotonic()
+
+    def observe(self, view, status, seconds, queries, query_seconds, size):
+        values = {'api_request_duration_seconds': seconds, 'api_request_queries': queries,
+                  'api_response_size_bytes': size}
+        indexes = {name: bisect.bisect_left(bounds, values[name]) for name, (_, bounds) in HISTOGRAMS.items()}
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = _empty_series()
+            series['status'][str(status)] = series['status'].get(str(status), 0) + 1
+            series['query_seconds'] += query_seconds
+            for name, index in indexes.items():
+                series[name]['buckets'][index] += 1
+                series[name]['sum'] += values[name]
+            flush = time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL
+            if flush:
+                self._flushed_at = time.monotonic()
+        if flush:
+            self.flush()
+
+    def path(self, pid=None):
+        return os.path.join(settings.METRICS_DIR, f'metrics-{pid or os.getpid()}.json')
+
+    def flush(self):
+        with self._lock:
+            payload = json.dumps(self._series)
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=settings.METRICS_DIR, prefix='.metrics-')
+        with os.fdopen(handle, 'w') as output:
+            output.write(payload)
+        os.replace(temporary, self.path())
+
+    def collect(self):
+        """
+        :return: Dict of view -> series, summed over the files of every process.
+        """
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, 'metrics-*.json')):
+            try:
+                with open(path) as handle:
+                    series_by_view = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            for view, series in series_by_view.items():
+                _merge(totals.setdefault(view, _empty_series()), series)
+        return totals
+
+    def render(self):
+        """
+        :return: The collected metrics in the Prometheus text exposition format.
+        """
+        totals = sorted(self.collect().items())
+        lines = ['# HELP api_requests_total Requests per view and status code.', '# TYPE api_requests_total counter']
+        for view, series in totals:
+            for status, count in sorted(series['status'].items()):
+                lines.append(f'api_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+        lines += ['# HELP api_query_duration_seconds_total Time spent in SQL queries per view.',
+                  '# TYPE api_query_duration_seconds_total counter']
+        for view, series in totals:
+            lines.append(f'api_query_duration_seconds_total{{view="{_label(view)}"}} {series["query_seconds"]}')
+        for name, (description, bounds) in HISTOGRAMS.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for view, series in totals:
+                labels = f'view="{_label(view)}"'
+                cumulative = 0
+                for bound, count in zip(list(bounds) + ['+Inf'], series[name]['buckets']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {series[name]["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def view_name(request):
+    """
+    :return: The resolved view and action such as `RecordsViewSet.list`, the same
+             for the sync viewsets and their async read views.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    func = match.func
+    initkwargs = getattr(func, 'view_initkwargs', {})
+    if initkwargs.get('viewset') is not None:
+        return f"{initkwargs['viewset'].__name__}.{initkwargs['action']}"
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if cls is None:
+        return f'{func.__module__}.{func.__name__}'
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f"{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+    return f'{cls.__name__}.{request.method.lower()}'
+
+
+class QueryRecorder:
+    """Counts and times the SQL queries of one request, fed by record_queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper adding each query to the recorder of the request running it, if any."""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.seconds += time.perf_counter() - started
+        recorder.count += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding record_queries to every new connection."""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+@sync_and_async_middleware
+def MetricsMiddleware(get_response):
+    """
+    Records the latency, SQL queries and response size of every request in `metrics`,
+    labelled with view_name(). Streaming responses are counted with a size of 0.
+    Concurrent ASGI requests share the thread-sensitive connection, so queries are
+    attributed through current_recorder rather than per request wrappers.
+    """
+
+    def record(request, response, started, recorder):
+        size = 0 if response.streaming else len(response.content)
+        metrics.observe(view_name(request), response.status_code, time.perf_counter() - started,
+                        recorder.count, recorder.seconds, size)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not settings.METRICS_ENABLED:
+                return await get_response(request)
+            recorder, started = QueryRecorder(), time.perf_counter()
+            token = current_recorder.set(recorder)
+            try:
+                response = await get_response(request)
+            finally:
+                current_recorder.reset(token)
+            record(request, response, started, recorder)
+            return response
+    else:
+        def middleware(request):
+            if not settings.METRICS_ENABLED:
+                return get_response(request)
+            recorder, started = QueryRecorder(), time.perf_counter()
+            token = current_recorder.set(recorder)
+            try:
+                response = get_response(request)
+            finally:
+                current_recorder.reset(token)
+            record(request, response, started, recorder)
+            return response
+    return middleware
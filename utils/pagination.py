@@ -0,0 +1,135 @@
+import json
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class BaseCursorPagination(CursorPagination):
+    """
+    Keyset pagination shared by the API listings.
+    The cursor encodes the (created_at, pk) position of the last row, so every
+    page is a range scan on the ordering index, even through runs of rows with
+    the same created_at: no OFFSET and no COUNT(*) per request.
+    paginate_queryset is split in two halves around the single page query so
+    the async read views can run that query with the async ORM.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+        return super().get_page_size(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([instance async for instance in page_queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self.position_filter(current_position, self.cursor.reverse))
+
+        self.offset, self.reverse, self.current_position = offset, reverse, current_position
+        # One extra row tells whether a following page exists.
+        return queryset[offset:offset + self.page_size + 1]
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = [instance[name] if isinstance(instance, dict) else getattr(instance, name)
+                  for name in (order.lstrip('-') for order in ordering[:2])]
+        return json.dumps([str(value) for value in values])
+
+    def position_filter(self, position, reverse):
+        """
+        :return: Q of the rows after position, (created_at, pk) > (a, b) spelled out as
+                 created_at >= a AND (created_at > a OR (created_at = a AND pk > b)), in the
+                 page direction. The leading bound lets SQLite seek the ordering index, which
+                 it does not do for the OR alone.
+        """
+        lookups = [(order.lstrip('-'), 'lt' if reverse != order.startswith('-') else 'gt')
+                   for order in self.ordering[:2]]
+        (first, first_lookup), (second, second_lookup) = lookups
+        try:
+            values = json.loads(position)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or len(values) != 2:
+            # Cursor issued before positions included the pk
+            return Q(**{f'{first}__{first_lookup}': position})
+        bound = 'gte' if first_lookup == 'gt' else 'lte'
+        return Q(**{f'{first}__{bound}': values[0]}) & (
+            Q(**{f'{first}__{first_lookup}': values[0]})
+            | Q(**{first: values[0], f'{second}__{second_lookup}': values[1]}))
+
+    def set_page(self, results):
+        offset, reverse, current_position = self.offset, self.reverse, self.current_position
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+class ClientCursorPagination(BaseCursorPagination):
+    ordering = ('created_at', 'user_id')
+
+
+class WarehouseCursorPagination(BaseCursorPagination):
+    ordering = ('created_at', 'id')
+
+
+class RecordsCursorPagination(BaseCursorPagination):
+    ordering = ('created_at', 'id_record')
+
+
+class DeactivationJobCursorPagination(BaseCursorPagination):
+    ordering = ('-created_at', '-id')
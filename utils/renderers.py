@@ -0,0 +1,37 @@
+import json
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingExportRenderer(BaseRenderer):
+    """
+    Negotiates ?format= for the export actions, which stream their own body.
+    Only error payloads go through render(), so they are written as JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, default=str).encode(self.charset)
+
+
+class CSVRenderer(StreamingExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(StreamingExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Writes the text exposition of utils.metrics as is, anything else (errors) as JSON."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return json.dumps(data, default=str).encode(self.charset)
@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from .cache import response_cache, written_key
+
+REPLICA_DB_ALIAS = 'replica'
+
+_read_database = ContextVar('read_database', default=None)
+_synced = {'key': None, 'at': None}
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of a request to the database chosen by route_reads(), and
+    every write, including saves of instances loaded from the replica, to default.
+    The replica is a copy made by sync_replica, so it is never migrated.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db == REPLICA_DB_ALIAS else None
+
+
+def route_reads(alias):
+    """Routes the reads of the current context to alias. :return: Token for reset_reads()."""
+    return _read_database.set(alias)
+
+
+def reset_reads(token):
+    _read_database.reset(token)
+
+
+def synced_path(path=None):
+    return f'{path or settings.DATABASE_REPLICA_NAME}.synced'
+
+
+def replica_synced_at():
+    """
+    :return: Time of the primary snapshot the replica holds, None if it was never synced.
+             The marker file is only re-read when its mtime changes.
+    """
+    if not settings.DATABASE_REPLICA_NAME:
+        return None
+    path = synced_path()
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    if _synced['key'] != key:
+        with open(path, encoding='utf-8') as handle:
+            _synced['at'] = json.load(handle)['synced_at']
+        _synced['key'] = key
+    return _synced['at']
+
+
+def read_database(scope):
+    """
+    :return: The replica when it is at most DATABASE_REPLICA_MAX_LAG seconds behind and
+             its snapshot is newer than the last committed write of the scope (so a
+             client reads its own writes, and no stale response is cached under a
+             version bumped by that write), default otherwise.
+    """
+    synced_at = replica_synced_at()
+    if synced_at is None or time.time() - synced_at > settings.DATABASE_REPLICA_MAX_LAG:
+        return DEFAULT_DB_ALIAS
+    written_at = response_cache().get(written_key(scope))
+    if written_at is not None and written_at >= synced_at:
+        return DEFAULT_DB_ALIAS
+    return REPLICA_DB_ALIAS
+
+
+def sync_replica(path=None, source=DEFAULT_DB_ALIAS):
+    """
+    Copies the primary SQLite database to the replica file with the online backup API,
+    on a connection of its own so it never waits on a transaction of the caller. The
+    copy is written next to the replica and renamed over it, so replica connections
+    opened afterwards see the new snapshot and open ones keep reading the previous one.
+    :return: Time of the snapshot.
+    """
+    path = path or settings.DATABASE_REPLICA_NAME
+    primary = connections[source]
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.replica-')
+    os.close(handle)
+    started = time.time()
+    origin = primary.get_new_connection(primary.get_connection_params())
+    try:
+        target = sqlite3.connect(temporary)
+        try:
+            origin.backup(target)
+            # A self-contained file, readable in mode=ro without -wal and -shm files
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    finally:
+        origin.close()
+    os.replace(temporary, path)
+
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.replica-')
+    with os.fdopen(handle, 'w', encoding='utf-8') as output:
+        json.dump({'synced_at': started, 'seconds': time.time() - started}, output)
+    os.replace(temporary, synced_path(path))
+    return started
@@ -0,0 +1,144 @@
+import glob
+import hashlib
+import os
+import tempfile
+import threading
+from importlib.metadata import version as package_version
+from django.conf import settings
+from django.http import HttpResponse
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+from rest_framework import status
+
+# Packages whose sources make up the schema, relative to BASE_DIR
+SCHEMA_SOURCES = ('app', 'project', 'utils')
+SCHEMA_PACKAGES = ('django', 'djangorestframework', 'djangorestframework-simplejwt', 'drf-spectacular')
+SCHEMA_RENDERERS = {renderer.format: renderer for renderer in (OpenApiYamlRenderer, OpenApiJsonRenderer)}
+
+_code_version = {}
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    """Documents CachedJWTAuthentication as the bearer JWT scheme it extends."""
+    target_class = 'utils.authentication.CachedJWTAuthentication'
+
+
+def code_version():
+    """
+    :return: API_SCHEMA_VERSION when the deploy sets it (such as the release commit), else a
+             hash of the project sources and of the packages that build the schema. Computed
+             once per process, along with the URLconf and SPECTACULAR_SETTINGS.
+    """
+    key = (settings.API_SCHEMA_VERSION, settings.ROOT_URLCONF, repr(settings.SPECTACULAR_SETTINGS))
+    if key not in _code_version:
+        digest = hashlib.sha256('|'.join(key).encode())
+        if not settings.API_SCHEMA_VERSION:
+            for name in SCHEMA_PACKAGES:
+                digest.update(f'{name}=={package_version(name)}'.encode())
+            for source in SCHEMA_SOURCES:
+                for path in sorted(glob.glob(os.path.join(settings.BASE_DIR, source, '**', '*.py'), recursive=True)):
+                    digest.update(os.path.relpath(path, settings.BASE_DIR).encode())
+                    with open(path, 'rb') as handle:
+                        digest.update(handle.read())
+        _code_version[key] = digest.hexdigest()[:16]
+    return _code_version[key]
+
+
+def generate_schema():
+    """:return: The rendered schema of the default URLconf in every format, keyed by format."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    return {name: renderer().render(schema) for name, renderer in SCHEMA_RENDERERS.items()}
+
+
+class SchemaCache:
+    """
+    The OpenAPI schema of the current code version, generated once and kept in memory
+    and in API_SCHEMA_CACHE_DIR as openapi-<version>.<format>, so the other worker
+    processes and later starts of the same version only read it. The ETag is the hash
+    of the content.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def path(self, name, version=None):
+        return os.path.join(settings.API_SCHEMA_CACHE_DIR, f'openapi-{version or code_version()}.{name}')
+
+    def get(self, name):
+        """:return: Tuple of the schema in the format and its ETag."""
+        key = (code_version(), name)
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(key) or self.load(name)
+        return entry
+
+    def load(self, name):
+        version = code_version()
+        try:
+            with open(self.path(name, version), 'rb') as handle:
+                contents = {name: handle.read()}
+        except FileNotFoundError:
+            contents = self.write(version)
+        for format_name, content in contents.items():
+            etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+            self._entries[(version, format_name)] = (content, etag)
+        return self._entries[(version, name)]
+
+    def write(self, version=None):
+        """Generates the schema and writes every format with an atomic rename. :return: The contents."""
+        version = version or code_version()
+        contents = generate_schema()
+        os.makedirs(settings.API_SCHEMA_CACHE_DIR, exist_ok=True)
+        for name, content in contents.items():
+            handle, temporary = tempfile.mkstemp(dir=settings.API_SCHEMA_CACHE_DIR, prefix='.openapi-')
+            with os.fdopen(handle, 'wb') as output:
+                output.write(content)
+            os.replace(temporary, self.path(name, version))
+        return contents
+
+    def prune(self):
+        """Deletes the files of other code versions. :return: Their paths."""
+        keep = {self.path(name) for name in SCHEMA_RENDERERS}
+        stale = [path for path in glob.glob(os.path.join(settings.API_SCHEMA_CACHE_DIR, 'openapi-*'))
+                 if path not in keep]
+        for path in stale:
+            os.unlink(path)
+        return stale
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+
+
+schema_cache = SchemaCache()
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """
+    Serves the schema from schema_cache, with its ETag and Cache-Control, instead of
+    walking every view on each fetch. Requests for another language or API version
+    are still generated.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if not settings.API_SCHEMA_CACHE_ENABLED or request.GET.get('lang') or request.GET.get('version'):
+            return super().get(request, *args, **kwargs)
+
+        renderer = request.accepted_renderer
+        content, etag = schema_cache.get(renderer.format)
+        headers = {
+            'ETag': etag, 'Vary': 'Accept',
+            'Cache-Control': f'public, max-age={settings.API_SCHEMA_CACHE_MAX_AGE}',
+            'Content-Disposition': f'inline; filename="{self._get_filename(request, None)}"',
+        }
+        if etag in request.headers.get('If-None-Match', ''):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        content_type = renderer.media_type + (f'; charset={renderer.charset}' if renderer.charset else '')
+        return HttpResponse(content, content_type=content_type, headers=headers)
@@ -0,0 +1,131 @@
+from datetime import timezone as dt_timezone
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+
+def parse_field_list(value):
+    """
+    Parses a comma separated query parameter such as ?fields=name,address.
+    :return: Set of names, or None when the parameter is absent or empty.
+    """
+    names = {name.strip() for name in (value or '').split(',') if name.strip()}
+    return names or None
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin honoring the `fields` and `expand` entries of its context.
+    Fields listed in Meta.expandable_fields are only rendered when expanded, and
+    when `fields` is given every other field is dropped.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = self.context.get('expand') or set()
+        for name in getattr(self.Meta, 'expandable_fields', ()):
+            if name not in expand:
+                self.fields.pop(name, None)
+        fields = self.context.get('fields')
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+def _iso_datetime(value):
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _is_utc(tz):
+    return tz is dt_timezone.utc or getattr(tz, 'key', None) == 'UTC'
+
+
+def _value_column(model, field):
+    """
+    :return: The .values() lookup read by a serializer field, or None when its source is not a column.
+    """
+    if field.source == '*':
+        return None
+    attrs = field.source_attrs
+    lookups = []
+    for index, attr in enumerate(attrs):
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            return None
+        last = index == len(attrs) - 1
+        if model_field.is_relation:
+            if last:
+                return '__'.join(lookups + [model_field.attname]) if model_field.concrete else None
+            lookups.append(model_field.name)
+            model = model_field.related_model
+        elif last:
+            lookups.append(model_field.name)
+            return '__'.join(lookups)
+        else:
+            return None
+
+
+def _value_converter(field):
+    """
+    :return: A function turning a column value into the field's representation,
+             or None when the field has no column-only equivalent.
+    """
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        # DRF renders the pk object itself, the JSON encoder formats it
+        return None if field.pk_field is not None else (lambda value: value)
+    if isinstance(field, serializers.RelatedField):
+        return None
+    if isinstance(field, serializers.UUIDField) and field.uuid_format == 'hex_verbose':
+        return str
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is not None and output_format.lower() == ISO_8601 and _is_utc(field_timezone):
+            # Aware values read in UTC: enforce_timezone would not change them
+            return lambda value: _iso_datetime(value) if value.tzinfo is dt_timezone.utc else field.to_representation(value)
+        return field.to_representation
+    if type(field) is serializers.CharField:
+        return str
+    if type(field) is serializers.IntegerField:
+        return int
+    if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer)):
+        return None
+    return field.to_representation
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path of a model serializer: output dicts are built from
+    .values() rows with a field -> (column, converter) plan computed once,
+    skipping model instantiation and the per-field get_attribute machinery.
+    The dicts equal the serializer's own output. Sources that are not a model
+    field path (properties) can be mapped in Meta.value_columns.
+    """
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.columns = list(dict.fromkeys(column for _, column, _ in plan))
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """
+        :param serializer: Bound serializer whose readable fields are rendered.
+        :return: A ValuesSerializer, or None when a field does not map to a column.
+        """
+        model = serializer.Meta.model
+        columns = getattr(serializer.Meta, 'value_columns', {})
+        plan = []
+        for field in serializer._readable_fields:
+            column = columns.get(field.field_name) or _value_column(model, field)
+            convert = _value_converter(field)
+            if column is None or convert is None:
+                return None
+            plan.append((field.field_name, column, convert))
+        return cls(plan)
+
+    def to_representation(self, rows):
+        plan = self.plan
+        return [{name: None if row[column] is None else convert(row[column]) for name, column, convert in plan}
+                for row in rows]
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging.handlers
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+from django.utils.decorators import sync_and_async_middleware
+from .metrics import view_name
+
+current_request = ContextVar('current_request', default=None)
+_explaining = ContextVar('explaining', default=False)
+
+_LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?+)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def fingerprint(sql):
+    """
+    :return: (hash, normalized SQL) where literals, placeholders and IN lists of any
+             length are collapsed, so every run of the same query shape groups together.
+    """
+    normalized = sql
+    for pattern, replacement in _LITERALS:
+        normalized = pattern.sub(replacement, normalized)
+    normalized = normalized.strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16], normalized
+
+
+class SlowQueryLog:
+    """
+    JSON lines file of the slow queries, rotated at SLOW_QUERY_LOG_MAX_BYTES.
+    The handler is opened on the first entry and reopened when the settings change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handler = None
+        self._options = None
+
+    def handler(self):
+        options = (str(settings.SLOW_QUERY_LOG_FILE), settings.SLOW_QUERY_LOG_MAX_BYTES,
+                   settings.SLOW_QUERY_LOG_BACKUP_COUNT)
+        with self._lock:
+            if self._options != options:
+                os.makedirs(os.path.dirname(options[0]) or '.', exist_ok=True)
+                if self._handler is not None:
+                    self._handler.close()
+                self._handler = logging.handlers.RotatingFileHandler(
+                    options[0], maxBytes=options[1], backupCount=options[2], encoding='utf-8', delay=True)
+                self._handler.setFormatter(logging.Formatter('%(message)s'))
+                self._options = options
+            return self._handler
+
+    def write(self, entry):
+        record = logging.LogRecord('slow_queries', logging.WARNING, __file__, 0, json.dumps(entry, default=str),
+                                   None, None)
+        self.handler().handle(record)
+
+    def close(self):
+        with self._lock:
+            if self._handler is not None:
+                self._handler.close()
+            self._handler = self._options = None
+
+
+slow_query_log = SlowQueryLog()
+
+
+def explain(connection, sql, params):
+    """
+    :return: EXPLAIN QUERY PLAN rows of a SQLite query as text, None for other statements.
+    """
+    if connection.vendor != 'sqlite' or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        _explaining.reset(token)
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    """Execute wrapper writing the queries slower than SLOW_QUERY_THRESHOLD_MS to slow_query_log."""
+    if not settings.SLOW_QUERY_LOG_ENABLED or _explaining.get():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+            request = current_request.get()
+            digest, normalized = fingerprint(sql)
+            slow_query_log.write({
+                'time': timezone.now().isoformat(),
+                'duration_ms': round(duration_ms, 3),
+                'fingerprint': digest,
+                'sql': normalized,
+                'view': view_name(request) if request is not None else None,
+                'database': context['connection'].alias,
+                'many': many,
+                'plan': None if many else explain(context['connection'], sql, params),
+            })
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    """connection_created receiver adding log_slow_queries to every new connection."""
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_slow_queries)
+
+
+@sync_and_async_middleware
+def SlowQueryMiddleware(get_response):
+    """Makes the request visible to log_slow_queries, which labels entries with its view."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current_request.set(request)
+            try:
+                return await get_response(request)
+            finally:
+                current_request.reset(token)
+    else:
+        def middleware(request):
+            token = current_request.set(request)
+            try:
+                return get_response(request)
+            finally:
+                current_request.reset(token)
+    return middleware
@@ -0,0 +1,34 @@
+from django.conf import settings
+
+
+def sqlite_pragmas(profile=None, read_only=False):
+    """
+    PRAGMA statements of the SQLite tuning profile.
+    :param profile: Mapping overriding settings.SQLITE_TUNING.
+    :param read_only: Leave out the statements a mode=ro connection cannot run.
+    :return: List of SQL statements, empty when the profile is disabled.
+    """
+    profile = settings.SQLITE_TUNING if profile is None else profile
+    if not profile.get('ENABLED', True):
+        return []
+    pragmas = [
+        ('journal_mode', profile.get('JOURNAL_MODE')),
+        ('synchronous', profile.get('SYNCHRONOUS')),
+        ('mmap_size', profile.get('MMAP_SIZE')),
+        ('cache_size', profile.get('CACHE_SIZE')),
+        ('busy_timeout', profile.get('BUSY_TIMEOUT')),
+        ('temp_store', profile.get('TEMP_STORE')),
+    ]
+    if read_only:
+        pragmas = [(name, value) for name, value in pragmas if name not in ('journal_mode', 'synchronous')]
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas if value is not None]
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """connection_created receiver applying the tuning profile to every new SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    read_only = 'mode=ro' in str(connection.settings_dict['NAME'])
+    with connection.cursor() as cursor:
+        for statement in sqlite_pragmas(read_only=read_only):
+            cursor.execute(statement)
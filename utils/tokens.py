@@ -0,0 +1,80 @@
+import hashlib
+import threading
+import time
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class BlacklistFilter:
+    """
+    In-process set of hashed jtis of blacklisted refresh tokens, placed in front
+    of the token_blacklist tables.
+    A jti that is not in the set is accepted without touching the database; a hit
+    (or a hash collision) is confirmed with the regular blacklist query.
+    Blacklist writes of this process are added on post_save, writes of other
+    processes are picked up by an incremental sync every
+    JWT_BLACKLIST_FILTER_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._hashes = set()
+            self._last_id = 0
+            self._synced_at = None
+
+    @staticmethod
+    def fingerprint(jti):
+        return int.from_bytes(hashlib.blake2b(jti.encode(), digest_size=8).digest(), 'big')
+
+    def add(self, jti):
+        with self._lock:
+            self._hashes.add(self.fingerprint(jti))
+
+    def sync(self):
+        with self._lock:
+            if self._synced_at is None:
+                # Warm with the tokens that can still be presented; expired ones fail before the check.
+                last_id = BlacklistedToken.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+                rows = BlacklistedToken.objects.filter(id__lte=last_id, token__expires_at__gt=timezone.now())
+            else:
+                last_id = None
+                rows = BlacklistedToken.objects.filter(id__gt=self._last_id)
+            for row_id, jti in rows.values_list('id', 'token__jti').iterator(chunk_size=5000):
+                self._hashes.add(self.fingerprint(jti))
+                if last_id is None or row_id > last_id:
+                    last_id = row_id
+            self._last_id = max(self._last_id, last_id or 0)
+            self._synced_at = time.monotonic()
+
+    def might_contain(self, jti):
+        synced_at = self._synced_at
+        if synced_at is None or time.monotonic() - synced_at >= settings.JWT_BLACKLIST_FILTER_SYNC_INTERVAL:
+            self.sync()
+        return self.fingerprint(jti) in self._hashes
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class FilteredTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = FilteredRefreshToken
@@ -1,5 +1,9 @@
 from rest_framework import generics, status
+from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from .cache import user_scope
+from .replica import read_database, reset_reads, route_reads
+from .serializers import ValuesSerializer, parse_field_list
 
 
 
@@ -14,3 +18,77 @@ class BaseView(generics.GenericAPIView):
         """
         errors = message if isinstance(message, dict) else {"detail": message}
         return Response({"errors": errors}, status=status_code)
+
+
+class ReplicaReadMixin:
+    """
+    Runs the queries of the read actions in replica_actions on the replica when it
+    is fresh enough for the user's scope, see utils.replica.read_database.
+    Authentication still reads the primary. Querysets evaluated after the view
+    returned, such as streamed exports, must be pinned with .using(queryset.db).
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        action = getattr(self, 'action', None) or request.method.lower()
+        if request.method in SAFE_METHODS and action in self.replica_actions:
+            self.read_database_token = route_reads(read_database(user_scope(request.user)))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'read_database_token', None)
+        if token is not None:
+            reset_reads(token)
+            self.read_database_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """
+    Reads ?fields= and ?expand= into the serializer context, see
+    utils.serializers.DynamicFieldsMixin. ?fields= only applies to reads.
+    """
+
+    def requested_fields(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        return parse_field_list(self.request.query_params.get('fields'))
+
+    def requested_expansions(self):
+        return parse_field_list(self.request.query_params.get('expand')) or set()
+
+    def wants_field(self, *names):
+        fields = self.requested_fields()
+        return fields is None or any(name in fields for name in names)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields()
+        context['expand'] = self.requested_expansions()
+        return context
+
+
+class ValuesListMixin:
+    """
+    Lists through utils.serializers.ValuesSerializer when every rendered field
+    maps to a column, falling back to the regular serializer otherwise
+    (e.g. expanded relations).
+    """
+
+    def get_values_serializer(self):
+        return ValuesSerializer.for_serializer(self.get_serializer())
+
+    def values_queryset(self, queryset, values_serializer):
+        # The cursor paginator reads its position from the ordering columns
+        ordering = [name.lstrip('-') for name in getattr(self.paginator, 'ordering', None) or ()]
+        return queryset.values(*values_serializer.columns, *ordering)
+
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.values_queryset(self.filter_queryset(self.get_queryset()), values_serializer)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values_serializer.to_representation(queryset))
+        return self.get_paginated_response(values_serializer.to_representation(page))